@@ -0,0 +1,141 @@
+import heapq
+import asyncio
+from datetime import datetime, timedelta
+from database.database import db
+from ratelimit import BULK
+from config import LOGGER, AUTO_DELETE_TIME, WORKER_PROCESSES, WORKER_SYNC_INTERVAL
+
+# Setting holding the auto-delete timer in seconds; 0 disables it
+AUTO_DELETE_SETTING = "auto_delete_time"
+# Most message ids one delete_messages call accepts
+DELETE_CHUNK_SIZE = 100
+
+class AutoDeleteScheduler:
+    """Deletes delivered messages once the auto-delete timer runs out.
+
+    Every deletion is written to the scheduled_deletions table before it
+    enters an in-memory heap ordered by due time. One task sleeps until
+    the earliest entry is due, then deletes everything due by then with
+    one delete_messages call per chat and 100 messages, and drops those
+    entries from the table. Entries left by a previous process are loaded
+    on start, so the overdue ones are deleted right away.
+
+    Only the leader process runs the task. With several processes, others
+    queue deletions this heap never sees, so the leader also wakes every
+    WORKER_SYNC_INTERVAL and drains whatever the table holds that is due.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.delay = AUTO_DELETE_TIME
+        self._heap = []  # (due_at, chat_id, message_id)
+        self._wake = asyncio.Event()
+        self._task = None
+        self.shared = WORKER_PROCESSES > 1
+        self.deleted = 0
+        self.failed = 0
+        self.logger = LOGGER(__name__)
+
+    async def start(self):
+        """Load the timer and the pending deletions, then start draining them"""
+        await self.reload_delay()
+        self._heap = [(due_at, chat_id, message_id) for chat_id, message_id, due_at in await db.get_scheduled_deletions()]
+        heapq.heapify(self._heap)
+        if self._heap:
+            overdue = sum(1 for due_at, _, _ in self._heap if due_at <= datetime.now())
+            self.logger.info(f"Recovered {len(self._heap)} scheduled deletions ({overdue} overdue)")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._heap = []
+
+    async def reload_delay(self):
+        """Pick up a timer set by another process"""
+        setting = await db.get_setting(AUTO_DELETE_SETTING)
+        self.delay = AUTO_DELETE_TIME if setting is None else int(setting)
+
+    async def set_delay(self, seconds: int):
+        """Persist a new timer for messages delivered from now on"""
+        await db.set_setting(AUTO_DELETE_SETTING, str(seconds))
+        self.delay = seconds
+
+    async def schedule(self, chat_id: int, message_ids, delay: int = None):
+        """Delete message_ids from chat_id after delay seconds (the current timer by default).
+
+        Returns the due time, or None when nothing was scheduled.
+        """
+        delay = self.delay if delay is None else delay
+        if not delay or not message_ids:
+            return None
+        due_at = datetime.now() + timedelta(seconds=delay)
+        await db.schedule_deletions([(chat_id, message_id, due_at) for message_id in message_ids])
+        if not self._task:
+            # The leader process deletes them
+            return due_at
+        earliest = self._heap[0][0] if self._heap else None
+        for message_id in message_ids:
+            heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        if earliest is None or due_at < earliest:
+            self._wake.set()
+        return due_at
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            wait = (self._heap[0][0] - datetime.now()).total_seconds() if self._heap else None
+            if self.shared:
+                wait = WORKER_SYNC_INTERVAL if wait is None else min(wait, WORKER_SYNC_INTERVAL)
+            if wait is None or wait > 0:
+                # Woken early when a sooner deletion is scheduled
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            await self._drain()
+
+    async def _drain(self):
+        """Delete everything due now and drop it from the table"""
+        now = datetime.now()
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due.setdefault(chat_id, set()).add(message_id)
+        if self.shared:
+            try:
+                for chat_id, message_id, _ in await db.get_scheduled_deletions(now):
+                    due.setdefault(chat_id, set()).add(message_id)
+            except Exception as e:
+                self.logger.warning(f"Failed to load due deletions: {e}")
+        if not due:
+            return
+        await asyncio.gather(*(self._delete_chat(chat_id, sorted(message_ids)) for chat_id, message_ids in due.items()))
+        try:
+            await db.remove_deletions([
+                (chat_id, message_id) for chat_id, message_ids in due.items() for message_id in message_ids
+            ])
+        except Exception as e:
+            # Left in the table, they are deleted again (harmlessly) after a restart
+            self.logger.warning(f"Failed to clear {sum(map(len, due.values()))} finished deletions: {e}")
+
+    async def _delete_chat(self, chat_id: int, message_ids):
+        """Delete one chat's due messages in bulk calls; failures are dropped, not retried"""
+        for i in range(0, len(message_ids), DELETE_CHUNK_SIZE):
+            chunk = message_ids[i:i+DELETE_CHUNK_SIZE]
+            try:
+                await self.bot.limiter.call(chat_id, self.bot.delete_messages, chat_id, chunk, priority=BULK)
+                self.deleted += len(chunk)
+            except Exception as e:
+                self.failed += len(chunk)
+                self.logger.warning(f"Failed to delete {len(chunk)} messages in {chat_id}: {e}")
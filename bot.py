@@ -7,6 +7,13 @@ from pyrogram.enums import ParseMode
 import sys
 from datetime import datetime
 from database.database import db
+from ratelimit import RateLimiter
+from broadcast import BroadcastManager
+from fsub import ForceSubscribe
+from autodelete import AutoDeleteScheduler
+from leader import Leadership
+from storage import StorageChannels
+from startup import StartupTracker
 from config import *
 
 name ="""
@@ -14,9 +21,10 @@ name ="""
 """
 
 class Bot(Client):
-    def __init__(self):
+    def __init__(self, worker_id: int = 0):
+        # Each worker process needs its own session file
         super().__init__(
-            name="Bot",
+            name="Bot" if worker_id == 0 else f"Bot-{worker_id}",
             api_hash=API_HASH,
             api_id=APP_ID,
             plugins={
@@ -26,27 +34,51 @@ class Bot(Client):
             bot_token=TG_BOT_TOKEN
         )
         self.LOGGER = LOGGER
+        self.worker_id = worker_id
+        self.limiter = RateLimiter(
+            global_rate=RATE_LIMIT_GLOBAL,
+            private_rate=RATE_LIMIT_PRIVATE,
+            group_rate=RATE_LIMIT_GROUP / 60,
+            chat_burst=RATE_LIMIT_CHAT_BURST
+        )
+        self.broadcasts = BroadcastManager(self)
+        self.fsub = ForceSubscribe(self)
+        self.auto_delete = AutoDeleteScheduler(self)
+        self.leadership = Leadership(self)
+        self.storage = StorageChannels(self)
+        self.startup = StartupTracker()
+        self._sync_task = None
+        self._notify_task = None
 
     async def start(self):
-        await super().start()
-        usr_bot_me = await self.get_me()
         self.uptime = datetime.now()
-        
-        # Initialize database
-        try:
-            await db.create_pool()
-        except Exception as e:
-            self.LOGGER(__name__).error(f"Database connection failed: {e}")
+
+        # Start Web Server first, so the health endpoint answers "starting" while the rest comes up
+        app = web.AppRunner(await web_server(self))
+        await app.setup()
+        # Worker processes share the port, the kernel spreads connections among them
+        await self.startup.run("web", web.TCPSite(app, "0.0.0.0", int(PORT), reuse_port=WORKER_PROCESSES > 1).start())
+
+        # Telegram and the database don't depend on each other
+        telegram, database = await asyncio.gather(
+            self.startup.run("telegram", super().start()),
+            self.startup.run("database", db.create_pool()),
+            return_exceptions=True
+        )
+        if isinstance(database, Exception):
+            self.LOGGER(__name__).error(f"Database connection failed: {database}")
             sys.exit()
+        if isinstance(telegram, Exception):
+            raise telegram
 
-        try:
-            db_channel = await self.get_chat(CHANNEL_ID)
-            self.db_channel = db_channel
-            test = await self.send_message(chat_id = db_channel.id, text = "Test Message")
-            await test.delete()
-        except Exception as e:
-            self.LOGGER(__name__).warning(e)
-            self.LOGGER(__name__).warning(f"Make Sure bot is Admin in DB Channel, and Double check the CHANNEL_ID Value, Current Value {CHANNEL_ID}")
+        usr_bot_me, _, writable = await asyncio.gather(
+            self.startup.run("get_me", self.get_me()),
+            self.startup.run("force_sub", self._load_fsub()),
+            self._elect_and_verify()
+        )
+        # Every storage channel was checked at once; those failing get no new uploads
+        if not writable:
+            self.LOGGER(__name__).warning(f"Make Sure bot is Admin in the DB Channels, and Double check the CHANNEL_ID and STORAGE_CHANNELS Values, Current Values {self.storage.ids}")
             self.LOGGER(__name__).info("\nBot Stopped. Join https://t.me/CodeflixSupport for support")
             sys.exit()
 
@@ -58,18 +90,55 @@ class Bot(Client):
         self.username = usr_bot_me.username
         self.LOGGER(__name__).info(f"Bot Running..! Made by @Codeflix_Bots")
 
-        # Start Web Server
-        app = web.AppRunner(await web_server())
-        await app.setup()
-        await web.TCPSite(app, "0.0.0.0", int(PORT)).start()
+        if WORKER_PROCESSES > 1:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+        # Nothing waits on the owner notification
+        if self.leadership.is_leader:
+            self._notify_task = asyncio.create_task(self._notify_owner())
+        self.startup.ready()
+
+    async def _load_fsub(self):
+        """Load the force subscribe channels; a failure only leaves the gate open"""
+        try:
+            await self.fsub.load()
+        except Exception as e:
+            self.LOGGER(__name__).warning(f"Failed to load force subscribe channels: {e}")
 
-        try: 
+    async def _elect_and_verify(self):
+        """Join the leader election, then check the storage channels; returns the writable ones"""
+        # The leader runs broadcasts, auto-delete and stats counts, resuming
+        # whatever the last shutdown interrupted; the test messages are its job too
+        leader = await self.startup.run("election", self.leadership.start())
+        return await self.startup.run("storage", self.storage.verify(test=leader))
+
+    async def _notify_owner(self):
+        """Tell the owner the bot restarted, off the startup path"""
+        try:
             await self.send_message(OWNER_ID, text = f"<b><blockquote> Bᴏᴛ Rᴇsᴛᴀʀᴛᴇᴅ by @Codeflix_Bots</blockquote></b>")
-        except: 
+        except Exception:
             pass
 
+    async def _sync_loop(self):
+        """Pick up settings other worker processes changed"""
+        while True:
+            await asyncio.sleep(WORKER_SYNC_INTERVAL)
+            try:
+                await self.fsub.load()
+                await self.auto_delete.reload_delay()
+            except Exception as e:
+                self.LOGGER(__name__).warning(f"Failed to sync shared settings: {e}")
+
     async def stop(self, *args):
+        if self._sync_task:
+            self._sync_task.cancel()
+        await self.leadership.stop()
         await super().stop()
+        try:
+            flushed = await db.flush_users()
+            self.LOGGER(__name__).info(f"Flushed {flushed} queued users on shutdown")
+        except Exception as e:
+            self.LOGGER(__name__).error(f"Failed to flush queued users: {e}")
         await db.close()
         self.LOGGER(__name__).info("Bot stopped.")
 
@@ -0,0 +1,173 @@
+import time
+import asyncio
+from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated
+from database.database import db
+from ratelimit import BULK, INTERACTIVE
+from config import LOGGER, BROADCAST_PAGE_SIZE, BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL, WORKER_SYNC_INTERVAL
+
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+def classify_failure(error: Exception) -> str:
+    """Delivery outcome recorded for a failed send"""
+    if isinstance(error, UserIsBlocked):
+        return "blocked"
+    if isinstance(error, InputUserDeactivated):
+        return "deactivated"
+    if isinstance(error, FloodWait):
+        return "flood"
+    return "other"
+
+def progress_text(job: dict) -> str:
+    """Status text for a broadcast job"""
+    processed = job["success"] + job["failed"]
+    percent = processed * 100 / job["total"] if job["total"] else 100
+    titles = {RUNNING: "📣 **Broadcasting...**", COMPLETED: "✅ **Broadcast Completed**", CANCELLED: "🛑 **Broadcast Cancelled**"}
+    return (
+        f"{titles.get(job['status'], job['status'])}\n\n"
+        f"🆔 Job: `{job['broadcast_id']}`\n"
+        f"📊 Progress: {processed}/{job['total']} ({percent:.1f}%)\n"
+        f"📤 Successfully sent: {job['success']}\n"
+        f"❌ Failed to send: {job['failed']}"
+    )
+
+class BroadcastManager:
+    """Runs broadcast jobs stored in the broadcasts table.
+
+    Recipients are streamed by keyset pagination and each page is
+    checkpointed, so a job picks up where it stopped after a restart.
+    Jobs only run in the leader process; any process may create one, and
+    the leader picks it up within WORKER_SYNC_INTERVAL.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.tasks = {}
+        self._cancelled = set()
+        self._watcher = None
+        self.logger = LOGGER(__name__)
+
+    async def start(self, from_chat_id: int, message_id: int, status_chat_id: int, status_message_id: int) -> int:
+        """Create a job, running it right away when this process leads"""
+        total = await db.get_reachable_users_count()
+        broadcast_id = await db.create_broadcast(from_chat_id, message_id, total, status_chat_id, status_message_id)
+        if self.bot.leadership.is_leader:
+            self._spawn(await db.get_broadcast(broadcast_id))
+        return broadcast_id
+
+    def watch(self):
+        """Run every running job, and keep picking up those created by other processes"""
+        if not self._watcher:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.resume_all()
+            except Exception as e:
+                self.logger.warning(f"Failed to resume broadcasts: {e}")
+            await asyncio.sleep(WORKER_SYNC_INTERVAL)
+
+    async def stop_all(self):
+        """Stop watching and stop every job; they stay running in the database for the next leader"""
+        tasks = [task for task in (self._watcher, *self.tasks.values()) if task]
+        self._watcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resume_all(self):
+        """Run every job marked running that this process isn't running yet"""
+        for job in await db.get_broadcasts(RUNNING):
+            if job["broadcast_id"] not in self.tasks:
+                self.logger.info(f"Resuming broadcast {job['broadcast_id']} after user {job['last_user_id']}")
+                self._spawn(job)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Cancel a running job; it stops after its in-flight sends"""
+        job = await db.get_broadcast(broadcast_id)
+        if not job or job["status"] != RUNNING:
+            return False
+        await db.set_broadcast_status(broadcast_id, CANCELLED)
+        self._cancelled.add(broadcast_id)
+        return True
+
+    def _spawn(self, job: dict):
+        """Run a job unless it already runs here; start and the watcher may both reach it"""
+        broadcast_id = job["broadcast_id"]
+        running = self.tasks.get(broadcast_id)
+        if running and not running.done():
+            return
+        task = asyncio.create_task(self._run(job))
+        self.tasks[broadcast_id] = task
+        task.add_done_callback(lambda done: self._forget(broadcast_id, done))
+
+    def _forget(self, broadcast_id: int, task: asyncio.Task):
+        if self.tasks.get(broadcast_id) is task:
+            del self.tasks[broadcast_id]
+
+    async def _send(self, job: dict, user_id: int, semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            if job["broadcast_id"] in self._cancelled:
+                return False
+            try:
+                await self.bot.limiter.call(
+                    user_id, self.bot.copy_message,
+                    chat_id=user_id,
+                    from_chat_id=job["from_chat_id"],
+                    message_id=job["message_id"],
+                    priority=BULK
+                )
+                return True
+            except Exception as e:
+                db.record_delivery_outcome(user_id, classify_failure(e))
+                return False
+
+    async def _update_status(self, job: dict):
+        if not job["status_chat_id"]:
+            return
+        try:
+            await self.bot.limiter.call(
+                job["status_chat_id"], self.bot.edit_message_text,
+                chat_id=job["status_chat_id"],
+                message_id=job["status_message_id"],
+                text=progress_text(job),
+                priority=INTERACTIVE
+            )
+        except Exception as e:
+            self.logger.warning(f"Failed to update broadcast {job['broadcast_id']} progress: {e}")
+
+    async def _run(self, job: dict):
+        broadcast_id = job["broadcast_id"]
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        next_update = 0.0
+        try:
+            job["status"] = COMPLETED
+            pages = db.iter_user_pages(batch_size=BROADCAST_PAGE_SIZE, after=job["last_user_id"], reachable=True)
+            async for rows in pages:
+                # Cancellation may come from this process or another one sharing the database
+                current = await db.get_broadcast(broadcast_id)
+                if broadcast_id in self._cancelled or not current or current["status"] != RUNNING:
+                    job["status"] = CANCELLED
+                    break
+                results = await asyncio.gather(*(self._send(job, row["user_id"], semaphore) for row in rows))
+                sent = sum(results)
+                job["success"] += sent
+                job["failed"] += len(results) - sent
+                job["last_user_id"] = rows[-1]["user_id"]
+                await db.checkpoint_broadcast(broadcast_id, job["last_user_id"], job["success"], job["failed"])
+                if time.monotonic() >= next_update:
+                    await self._update_status(job)
+                    next_update = time.monotonic() + BROADCAST_PROGRESS_INTERVAL
+            if job["status"] == COMPLETED:
+                await db.set_broadcast_status(broadcast_id, COMPLETED)
+            await self._update_status(job)
+            self.logger.info(f"Broadcast {broadcast_id} {job['status']}: {job['success']} sent, {job['failed']} failed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Left as running so the next start resumes it from the last checkpoint
+            self.logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+        finally:
+            self._cancelled.discard(broadcast_id)
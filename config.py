@@ -24,6 +24,8 @@ API_HASH = os.environ.get("API_HASH", "") #Your API Hash from my.telegram.org
 #--------------------------------------------
 
 CHANNEL_ID = int(os.environ.get("CHANNEL_ID", "-1001234567890")) #Your db channel Id
+STORAGE_CHANNELS = [CHANNEL_ID] + [int(c) for c in os.environ.get("STORAGE_CHANNELS", "").replace(",", " ").split()] # Extra db channel ids after CHANNEL_ID; only ever append, links store each channel's position
+STORAGE_PLACEMENT = os.environ.get("STORAGE_PLACEMENT", "round_robin") # How uploads pick a channel: round_robin, or lru for the one written to least recently
 OWNER = os.environ.get("OWNER", "owner") # Owner username without @
 OWNER_ID = int(os.environ.get("OWNER_ID", "123456789")) # Owner id
 #--------------------------------------------
@@ -32,10 +34,47 @@ PORT = os.environ.get("PORT", "5000")
 # Use PostgreSQL instead of MongoDB
 DB_URI = os.environ.get("DATABASE_URL", "")
 DB_NAME = os.environ.get("DATABASE_NAME", "filestore")
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2")) # Connections kept open at all times
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "20")) # Upper bound on connections, size it to the worker count
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "200")) # Prepared statements cached per connection
+DB_ACQUIRE_TIMEOUT = float(os.environ.get("DB_ACQUIRE_TIMEOUT", "10")) # Seconds to wait for a free connection before failing
+DB_CONN_MAX_QUERIES = int(os.environ.get("DB_CONN_MAX_QUERIES", "50000")) # Queries after which a connection is recycled
+DB_CONN_MAX_IDLE = float(os.environ.get("DB_CONN_MAX_IDLE", "300")) # Seconds an idle connection above the minimum is kept
+USER_FLUSH_SIZE = int(os.environ.get("USER_FLUSH_SIZE", "500")) # Flush queued user upserts once this many are pending
+USER_FLUSH_INTERVAL = float(os.environ.get("USER_FLUSH_INTERVAL", "2")) # Max seconds a queued user upsert waits before flush
+STATS_REFRESH_INTERVAL = int(os.environ.get("STATS_REFRESH_INTERVAL", "60")) # Seconds between stats snapshot refreshes
+ACTIVE_USER_DAYS = int(os.environ.get("ACTIVE_USER_DAYS", "7")) # Users seen today or in the days before, this many days in all, count as active
+SIGNUP_WINDOW_DAYS = int(os.environ.get("SIGNUP_WINDOW_DAYS", "7")) # Days, today included, counted as recent signups in the stats
+#--------------------------------------------
+FILE_CACHE_MAX_ENTRIES = int(os.environ.get("FILE_CACHE_MAX_ENTRIES", "50000")) # Max channel messages kept in the delivery cache
+FILE_CACHE_MAX_BYTES = int(os.environ.get("FILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))) # Approx memory cap of the delivery cache
+FILE_CACHE_TTL = int(os.environ.get("FILE_CACHE_TTL", "3600")) # Seconds a cached channel message stays valid
+DELIVERY_CONCURRENCY = int(os.environ.get("DELIVERY_CONCURRENCY", "50")) # Max file sends in flight across all chats
+DELIVERY_MAX_RETRIES = int(os.environ.get("DELIVERY_MAX_RETRIES", "3")) # FloodWait retries per delivered file
+RATE_LIMIT_GLOBAL = float(os.environ.get("RATE_LIMIT_GLOBAL", "30")) # Outgoing calls per second across all chats
+RATE_LIMIT_PRIVATE = float(os.environ.get("RATE_LIMIT_PRIVATE", "1")) # Messages per second to one private chat
+RATE_LIMIT_GROUP = float(os.environ.get("RATE_LIMIT_GROUP", "20")) # Messages per minute to one group or channel
+RATE_LIMIT_CHAT_BURST = float(os.environ.get("RATE_LIMIT_CHAT_BURST", "3")) # Messages one chat may receive back to back
+BROADCAST_PAGE_SIZE = int(os.environ.get("BROADCAST_PAGE_SIZE", "500")) # Recipients loaded and checkpointed per broadcast step
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "30")) # Broadcast sends in flight per job
+BROADCAST_PROGRESS_INTERVAL = int(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "15")) # Seconds between broadcast progress edits
+BATCH_PAGE_SIZE = int(os.environ.get("BATCH_PAGE_SIZE", "100")) # Files sent per page of a batch link before asking for the next page
+MEDIA_GROUP_DELIVERY = os.environ.get("MEDIA_GROUP_DELIVERY", "False") == "True" # Bundle batch files into albums of up to 10
+LINK_SECRET = os.environ.get("LINK_SECRET", "") # Signs share links with a short HMAC tag when set; unsigned links are then refused
+ALLOW_LEGACY_LINKS = os.environ.get("ALLOW_LEGACY_LINKS", "False") == "True" # With LINK_SECRET set, still accept old get- links shared before it; anyone can forge those
+INGEST_WINDOW = float(os.environ.get("INGEST_WINDOW", "2")) # Seconds of quiet after an admin's last upload before the batch is stored
+INGEST_MAX_WAIT = float(os.environ.get("INGEST_MAX_WAIT", "10")) # Max seconds an upload waits in the ingestion buffer
+AUTO_DELETE_TIME = int(os.environ.get("AUTO_DELETE_TIME", "0")) # Seconds before delivered files are deleted, until /dlt_time sets it; 0 keeps them
+INGEST_MAX_FILES = int(os.environ.get("INGEST_MAX_FILES", "100")) # Store the buffered uploads at once when this many are waiting
 #--------------------------------------------
 FSUB_LINK_EXPIRY = int(os.getenv("FSUB_LINK_EXPIRY", "10"))  # 0 means no expiry
+FSUB_MEMBER_TTL = int(os.environ.get("FSUB_MEMBER_TTL", "300")) # Seconds a confirmed channel membership is trusted without asking Telegram
+FSUB_NON_MEMBER_TTL = int(os.environ.get("FSUB_NON_MEMBER_TTL", "5")) # Seconds a missing membership is cached, short so users who just joined pass quickly
+FSUB_CACHE_MAX_ENTRIES = int(os.environ.get("FSUB_CACHE_MAX_ENTRIES", "100000")) # Max (user, channel) memberships kept in memory
 BAN_SUPPORT = os.environ.get("BAN_SUPPORT", "https://t.me/CodeflixSupport")
 TG_BOT_WORKERS = int(os.environ.get("TG_BOT_WORKERS", "200"))
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "1")) # Bot processes sharing the database, each with its own session; above 1 needs PostgreSQL
+WORKER_SYNC_INTERVAL = float(os.environ.get("WORKER_SYNC_INTERVAL", "10")) # Seconds between pickups of work and settings changed by other processes
 #--------------------------------------------
 START_PIC = os.environ.get("START_PIC", "https://telegra.ph/file/ec17880d61180d3312d6a.jpg")
 FORCE_PIC = os.environ.get("FORCE_PIC", "https://telegra.ph/file/e292b12890b8b4b9dcbd1.jpg")
@@ -1 +1 @@
-# Database module for PostgreSQL
\ No newline at end of file
+# Database module: PostgreSQL, SQLite and in-memory storage backends
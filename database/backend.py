@@ -0,0 +1,129 @@
+from datetime import datetime
+from typing import Protocol, List, Dict, Any, Optional, Set, Tuple, Mapping, Callable, Awaitable
+
+# Columns the streaming user iterators may select
+USER_COLUMNS = ('user_id', 'username', 'first_name', 'last_name', 'is_banned', 'created_at',
+                'delivery_status', 'delivery_checked_at', 'last_seen_at')
+# Smallest BIGINT, the keyset start that includes every user
+MIN_USER_ID = -2 ** 63
+
+# Delivery outcomes after which a user is never messaged again (until they /start again)
+DEAD_STATUSES = ('blocked', 'deactivated')
+# Users that may still receive broadcasts; the Postgres partial index uses the
+# same expression, so keep queries on this exact text to let the planner use it
+REACHABLE_USERS_SQL = "(delivery_status IS NULL OR delivery_status NOT IN ('blocked', 'deactivated'))"
+
+class LatencyStats:
+    """Count, mean and max of a timed operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class StorageBackend(Protocol):
+    """Storage operations behind Database.
+
+    Database keeps the in-process state (write-behind queues, banned set,
+    stats snapshot) and calls a backend for everything that is persisted.
+    Rows returned to callers are mappings indexed by column name.
+    """
+
+    name: str
+
+    async def connect(self): ...
+    async def close(self): ...
+    def metrics(self) -> Dict[str, Any]: ...
+
+    # Runs until cancelled, calling apply(user_id, banned) for ban changes made by
+    # other processes and reload() whenever changes may have been missed
+    async def watch_bans(self, apply: Callable[[int, bool], None], reload: Callable[[], Awaitable[None]]): ...
+
+    # Runs until cancelled, calling on_change(True) when this process becomes the
+    # leader and on_change(False) when another process leads or leadership is lost
+    async def hold_leadership(self, on_change: Callable[[bool], Awaitable[None]]): ...
+
+    # Users
+    async def upsert_users(self, rows: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]): ...
+    async def get_user(self, user_id: int) -> Optional[Dict]: ...
+    async def set_user_banned(self, user_id: int, banned: bool): ...
+    async def get_banned_ids(self) -> Set[int]: ...
+    async def get_banned_users(self) -> List[Dict]: ...
+    async def get_all_users(self) -> List[Dict]: ...
+    async def get_user_page(self, columns: List[str], after: int, limit: int,
+                            banned: Optional[bool], reachable: bool) -> List[Mapping]: ...
+    async def get_users_count(self) -> int: ...
+    async def get_banned_count(self) -> int: ...
+    async def get_reachable_users_count(self) -> int: ...
+    async def get_stats(self, active_days: int, signup_days: int) -> Dict[str, int]: ...
+
+    # Delivery outcomes
+    async def set_delivery_outcomes(self, outcomes: List[Tuple[int, str]]): ...
+    async def get_delivery_status_counts(self) -> Dict[str, int]: ...
+    async def purge_dead_users(self) -> int: ...
+
+    # Broadcast jobs
+    async def create_broadcast(self, from_chat_id: int, message_id: int, total: int,
+                               status_chat_id: int = None, status_message_id: int = None) -> int: ...
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]: ...
+    async def get_broadcasts(self, status: str) -> List[Dict]: ...
+    async def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, success: int, failed: int): ...
+    async def set_broadcast_status(self, broadcast_id: int, status: str): ...
+
+    # Admins
+    async def add_admin(self, admin_id: int): ...
+    async def remove_admin(self, admin_id: int): ...
+    async def is_admin(self, admin_id: int) -> bool: ...
+    async def get_all_admins(self) -> List[int]: ...
+
+    # Force subscribe channels
+    async def add_force_sub_channel(self, channel_id: int, channel_username: str = None): ...
+    async def remove_force_sub_channel(self, channel_id: int): ...
+    async def get_force_sub_channels(self) -> List[Dict]: ...
+
+    # File catalog
+    async def add_files(self, records: List[Dict]): ...
+    async def get_files_range(self, first_id: int, last_id: int, channel: int = 0) -> Dict[int, Dict]: ...
+    async def find_files_by_unique_id(self, unique_ids: List[str]) -> Dict[str, Tuple[int, int]]: ...
+
+    # Batch delivery progress
+    async def get_delivery_progress(self, user_id: int, batch_key: str) -> Optional[int]: ...
+    async def set_delivery_progress(self, user_id: int, batch_key: str, next_offset: int): ...
+    async def clear_delivery_progress(self, user_id: int, batch_key: str): ...
+
+    # Auto-delete queue
+    async def schedule_deletions(self, rows: List[Tuple[int, int, datetime]]): ...
+    async def get_scheduled_deletions(self, due_before: datetime = None) -> List[Tuple[int, int, datetime]]: ...
+    async def remove_deletions(self, keys: List[Tuple[int, int]]): ...
+
+    # Settings
+    async def set_setting(self, key: str, value: str): ...
+    async def get_setting(self, key: str) -> Optional[str]: ...
+
+def create_backend(url: Optional[str]) -> StorageBackend:
+    """Pick a backend from the DATABASE_URL scheme.
+
+    postgres:// and postgresql:// (or no URL, using the libpq environment)
+    use asyncpg, sqlite:///relative.db and sqlite:////absolute.db use an
+    embedded SQLite file, and memory:// keeps everything in process.
+    """
+    scheme = url.split("://", 1)[0].lower() if url and "://" in url else "postgresql"
+    if scheme in ("postgres", "postgresql"):
+        from database.postgres import PostgresBackend
+        return PostgresBackend(url)
+    if scheme == "sqlite":
+        from database.sqlite import SQLiteBackend
+        return SQLiteBackend(url[len("sqlite:///"):] or ":memory:")
+    if scheme == "memory":
+        from database.memory import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unsupported DATABASE_URL scheme: {scheme}")
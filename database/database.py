@@ -1,186 +1,265 @@
 import os
+import json
+import time
 import asyncio
-import asyncpg
-from typing import List, Dict, Any, Optional
-from config import LOGGER
+from typing import List, Dict, Any, Optional, Set, AsyncIterator, Iterable, Mapping
+from database.backend import create_backend, USER_COLUMNS, MIN_USER_ID
+from config import LOGGER, USER_FLUSH_SIZE, USER_FLUSH_INTERVAL, STATS_REFRESH_INTERVAL, ACTIVE_USER_DAYS, SIGNUP_WINDOW_DAYS
+
+# Setting holding the leader's latest stats snapshot as JSON
+STATS_SETTING = "stats_snapshot"
 
 class Database:
+    """In-process state in front of a storage backend.
+
+    Write-behind queues, the banned set and the stats snapshot live here;
+    everything persisted goes through the backend picked from DATABASE_URL.
+    Backend operations without process-side state are reached directly as
+    db.<name> through __getattr__.
+    """
+
     def __init__(self):
-        self.pool = None
         self.db_url = os.environ.get("DATABASE_URL")
+        self.backend = create_backend(self.db_url)
+        self.connected = False
         self.logger = LOGGER(__name__)
 
+        # Write-behind user queue, keyed by user_id so repeated /starts coalesce
+        self._user_queue: Dict[int, tuple] = {}
+        self._user_flush_event = asyncio.Event()
+        self._user_flush_lock = asyncio.Lock()
+        self._user_flush_task = None
+        self.user_flush_stats = {
+            "flushes": 0,
+            "flushed_users": 0,
+            "last_flush_size": 0,
+            "last_flush_latency": 0.0,
+            "max_flush_latency": 0.0,
+        }
+
+        # Write-behind delivery outcomes, keyed by user_id
+        self._outcome_queue: Dict[int, str] = {}
+
+        # In-process banned set, kept in sync across processes by the backend's ban watcher
+        self.banned_ids: Set[int] = set()
+        self._ban_listener_task = None
+
+        # Stats read by handlers, refreshed periodically from the backend
+        self.stats_snapshot: Dict[str, Any] = {}
+        # Only the leader process counts; the others read what it published
+        self.stats_leader = True
+        self._stats_refresh_task = None
+
+    def __getattr__(self, name: str):
+        # Only reached for names Database doesn't define itself
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
     async def create_pool(self):
-        """Create connection pool"""
+        """Connect the storage backend and start the background loops"""
         try:
-            self.pool = await asyncpg.create_pool(
-                self.db_url,
-                min_size=1,
-                max_size=10
+            await self.backend.connect()
+            self.connected = True
+            await self.reload_banned_users()
+            self._user_flush_task = asyncio.create_task(self._user_flush_loop())
+            self._ban_listener_task = asyncio.create_task(
+                self.backend.watch_bans(self._apply_ban, self.reload_banned_users)
             )
-            await self.create_tables()
-            self.logger.info("Database connected successfully")
+            await self.refresh_stats()
+            self._stats_refresh_task = asyncio.create_task(self._stats_refresh_loop())
+            self.logger.info(f"Database connected successfully ({self.backend.name})")
         except Exception as e:
             self.logger.error(f"Failed to connect to database: {e}")
             raise
 
-    async def create_tables(self):
-        """Create necessary tables"""
-        async with self.pool.acquire() as conn:
-            # Users table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username VARCHAR(255),
-                    first_name VARCHAR(255),
-                    last_name VARCHAR(255),
-                    is_banned BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Admins table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    admin_id BIGINT PRIMARY KEY,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Force subscribe channels table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS force_subscribe_channels (
-                    channel_id BIGINT PRIMARY KEY,
-                    channel_username VARCHAR(255),
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Bot settings table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS bot_settings (
-                    key VARCHAR(255) PRIMARY KEY,
-                    value TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def pool_stats(self) -> Dict[str, Any]:
+        """Backend utilization and latency metrics, tagged with the backend name"""
+        return self.backend.metrics()
 
     async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-        """Add or update user"""
-        if not self.pool:
-            await self.create_pool()
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO users (user_id, username, first_name, last_name)
-                VALUES ($1, $2, $3, $4)
-                ON CONFLICT (user_id) DO UPDATE SET
-                username = $2, first_name = $3, last_name = $4
-            ''', user_id, username, first_name, last_name)
-
-    async def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user by ID"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
-            return dict(row) if row else None
+        """Queue a user upsert, written in bulk by the flusher"""
+        self._user_queue[user_id] = (user_id, username, first_name, last_name)
+        if len(self._user_queue) >= USER_FLUSH_SIZE:
+            self._user_flush_event.set()
+
+    @property
+    def user_queue_depth(self) -> int:
+        """Number of user upserts waiting to be flushed"""
+        return len(self._user_queue)
+
+    async def _user_flush_loop(self):
+        """Flush queued users and outcomes when the batch is full or the interval elapses"""
+        while True:
+            try:
+                await asyncio.wait_for(self._user_flush_event.wait(), USER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._user_flush_event.clear()
+            try:
+                await self.flush_users()
+            except Exception as e:
+                self.logger.error(f"Failed to flush queued users: {e}")
+            try:
+                await self.flush_delivery_outcomes()
+            except Exception as e:
+                self.logger.error(f"Failed to flush delivery outcomes: {e}")
+
+    async def flush_users(self) -> int:
+        """Write every queued user upsert in a single backend call"""
+        async with self._user_flush_lock:
+            if not self._user_queue or not self.connected:
+                return 0
+            batch, self._user_queue = self._user_queue, {}
+            started = time.perf_counter()
+            try:
+                await self.backend.upsert_users(list(batch.values()))
+            except BaseException:
+                # Re-queue the batch without clobbering fresher entries queued meanwhile;
+                # a flusher cancelled at shutdown mid-write must not lose it either
+                for user_id, row in batch.items():
+                    self._user_queue.setdefault(user_id, row)
+                raise
+            latency = time.perf_counter() - started
+            stats = self.user_flush_stats
+            stats["flushes"] += 1
+            stats["flushed_users"] += len(batch)
+            stats["last_flush_size"] = len(batch)
+            stats["last_flush_latency"] = latency
+            stats["max_flush_latency"] = max(stats["max_flush_latency"], latency)
+            return len(batch)
+
+    def record_delivery_outcome(self, user_id: int, status: str):
+        """Queue a failed delivery outcome for user_id, written in bulk by the flusher"""
+        self._outcome_queue[user_id] = status
+        if len(self._outcome_queue) >= USER_FLUSH_SIZE:
+            self._user_flush_event.set()
+
+    async def flush_delivery_outcomes(self) -> int:
+        """Write every queued delivery outcome in a single backend call"""
+        if not self._outcome_queue or not self.connected:
+            return 0
+        batch, self._outcome_queue = self._outcome_queue, {}
+        try:
+            await self.backend.set_delivery_outcomes(list(batch.items()))
+        except BaseException:
+            for user_id, status in batch.items():
+                self._outcome_queue.setdefault(user_id, status)
+            raise
+        return len(batch)
 
     async def ban_user(self, user_id: int):
         """Ban a user"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('UPDATE users SET is_banned = TRUE WHERE user_id = $1', user_id)
+        await self.backend.set_user_banned(user_id, True)
+        self.banned_ids.add(user_id)
 
     async def unban_user(self, user_id: int):
         """Unban a user"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('UPDATE users SET is_banned = FALSE WHERE user_id = $1', user_id)
+        await self.backend.set_user_banned(user_id, False)
+        self.banned_ids.discard(user_id)
 
     async def is_user_banned(self, user_id: int) -> bool:
-        """Check if user is banned"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT is_banned FROM users WHERE user_id = $1', user_id)
-            return row['is_banned'] if row else False
-
-    async def get_banned_users(self) -> List[Dict]:
-        """Get all banned users"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT * FROM users WHERE is_banned = TRUE')
-            return [dict(row) for row in rows]
-
-    async def get_all_users(self) -> List[Dict]:
-        """Get all users"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT * FROM users')
-            return [dict(row) for row in rows]
-
-    async def add_admin(self, admin_id: int):
-        """Add admin"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO admins (admin_id) VALUES ($1)
-                ON CONFLICT (admin_id) DO NOTHING
-            ''', admin_id)
-
-    async def remove_admin(self, admin_id: int):
-        """Remove admin"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('DELETE FROM admins WHERE admin_id = $1', admin_id)
-
-    async def is_admin(self, admin_id: int) -> bool:
-        """Check if user is admin"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT admin_id FROM admins WHERE admin_id = $1', admin_id)
-            return bool(row)
-
-    async def get_all_admins(self) -> List[int]:
-        """Get all admins"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT admin_id FROM admins')
-            return [row['admin_id'] for row in rows]
-
-    async def add_force_sub_channel(self, channel_id: int, channel_username: str = None):
-        """Add force subscribe channel"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO force_subscribe_channels (channel_id, channel_username)
-                VALUES ($1, $2)
-                ON CONFLICT (channel_id) DO UPDATE SET channel_username = $2
-            ''', channel_id, channel_username)
-
-    async def remove_force_sub_channel(self, channel_id: int):
-        """Remove force subscribe channel"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('DELETE FROM force_subscribe_channels WHERE channel_id = $1', channel_id)
-
-    async def get_force_sub_channels(self) -> List[Dict]:
-        """Get all force subscribe channels"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT * FROM force_subscribe_channels')
-            return [dict(row) for row in rows]
-
-    async def set_setting(self, key: str, value: str):
-        """Set bot setting"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO bot_settings (key, value)
-                VALUES ($1, $2)
-                ON CONFLICT (key) DO UPDATE SET value = $2, updated_at = CURRENT_TIMESTAMP
-            ''', key, value)
-
-    async def get_setting(self, key: str) -> Optional[str]:
-        """Get bot setting"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT value FROM bot_settings WHERE key = $1', key)
-            return row['value'] if row else None
-
-    async def get_users_count(self) -> int:
-        """Get total users count"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT COUNT(*) as count FROM users')
-            return row['count']
+        """Check if user is banned, from the in-process banned set"""
+        return user_id in self.banned_ids
+
+    async def reload_banned_users(self):
+        """Replace the in-process banned set with the current table contents"""
+        self.banned_ids = await self.backend.get_banned_ids()
+
+    def _apply_ban(self, user_id: int, banned: bool):
+        """Apply a ban change made by another process to the banned set"""
+        if banned:
+            self.banned_ids.add(user_id)
+        else:
+            self.banned_ids.discard(user_id)
+
+    async def iter_user_pages(self, columns: Iterable[str] = ('user_id',), batch_size: int = 1000,
+                              after: int = MIN_USER_ID, banned: Optional[bool] = None,
+                              reachable: bool = False) -> AsyncIterator[List[Mapping]]:
+        """Stream users in user_id order as pages of records holding only the requested columns.
+
+        Uses keyset pagination, so no transaction or cursor is held between pages.
+        banned filters on the ban flag, reachable skips users in DEAD_STATUSES.
+        """
+        columns = list(columns)
+        for column in columns:
+            if column not in USER_COLUMNS:
+                raise ValueError(f"Unknown user column: {column}")
+        if 'user_id' not in columns:
+            columns.insert(0, 'user_id')
+
+        while True:
+            rows = await self.backend.get_user_page(columns, after, batch_size, banned, reachable)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]['user_id']
+
+    async def iter_users(self, columns: Iterable[str] = ('user_id',), batch_size: int = 1000,
+                         banned: Optional[bool] = None, reachable: bool = False) -> AsyncIterator[Mapping]:
+        """Stream users one record at a time, fetched in pages of batch_size"""
+        async for rows in self.iter_user_pages(columns, batch_size, banned=banned, reachable=reachable):
+            for row in rows:
+                yield row
+
+    async def iter_banned_users(self, columns: Iterable[str] = ('user_id',), batch_size: int = 1000) -> AsyncIterator[Mapping]:
+        """Stream banned users one record at a time"""
+        async for row in self.iter_users(columns, batch_size, banned=True):
+            yield row
+
+    async def refresh_stats(self) -> Dict[str, Any]:
+        """Reload the stats snapshot.
+
+        The leader process counts from the backend and publishes the result
+        in bot_settings; other processes load the published snapshot instead
+        of repeating the counts.
+        """
+        published = None
+        if not self.stats_leader:
+            published = await self.backend.get_setting(STATS_SETTING)
+        if published:
+            snapshot = json.loads(published)
+        else:
+            snapshot = await self.backend.get_stats(ACTIVE_USER_DAYS, SIGNUP_WINDOW_DAYS)
+            snapshot["active_days"] = ACTIVE_USER_DAYS
+            snapshot["signup_days"] = SIGNUP_WINDOW_DAYS
+            snapshot["refreshed_at"] = time.time()
+            if self.stats_leader:
+                await self.backend.set_setting(STATS_SETTING, json.dumps(snapshot))
+        self.stats_snapshot = snapshot
+        return snapshot
+
+    async def _stats_refresh_loop(self):
+        """Refresh the stats snapshot every STATS_REFRESH_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(STATS_REFRESH_INTERVAL)
+            try:
+                await self.refresh_stats()
+            except Exception as e:
+                self.logger.warning(f"Failed to refresh stats: {e}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get the latest stats snapshot, loading it if it was never refreshed"""
+        if not self.stats_snapshot:
+            return await self.refresh_stats()
+        return self.stats_snapshot
 
     async def close(self):
         """Close database connection"""
-        if self.pool:
-            await self.pool.close()
+        for task in (self._user_flush_task, self._ban_listener_task, self._stats_refresh_task):
+            if task:
+                task.cancel()
+        self._user_flush_task = self._ban_listener_task = self._stats_refresh_task = None
+        if self.connected:
+            try:
+                await self.flush_users()
+                await self.flush_delivery_outcomes()
+            except Exception as e:
+                self.logger.error(f"Failed to flush queued writes on close: {e}")
+            await self.backend.close()
+            self.connected = False
 
 # Global database instance
 db = Database()
\ No newline at end of file
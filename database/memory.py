@@ -0,0 +1,296 @@
+import bisect
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, Awaitable
+from database.backend import DEAD_STATUSES
+
+def _new_user(user_id: int) -> Dict:
+    return {
+        'user_id': user_id, 'username': None, 'first_name': None, 'last_name': None,
+        'is_banned': False, 'created_at': datetime.now(), 'delivery_status': None,
+        'delivery_checked_at': None, 'last_seen_at': None,
+    }
+
+def _reachable(user: Dict) -> bool:
+    return user['delivery_status'] not in DEAD_STATUSES
+
+class MemoryBackend:
+    """Process-local storage in plain dicts, lost on exit.
+
+    Meant for development and tests: every operation completes without
+    I/O, and user_ids are kept in a sorted list for keyset pages.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.users: Dict[int, Dict] = {}
+        self._user_ids: List[int] = []
+        self.admins: Dict[int, datetime] = {}
+        self.force_sub_channels: Dict[int, Dict] = {}
+        self.files: Dict[Tuple[int, int], Dict] = {}
+        self._files_by_unique_id: Dict[str, Set[Tuple[int, int]]] = {}
+        self.delivery_progress: Dict[Tuple[int, str], int] = {}
+        self.broadcasts: Dict[int, Dict] = {}
+        self.settings: Dict[str, str] = {}
+        self.scheduled_deletions: Dict[Tuple[int, int], datetime] = {}
+        self._next_broadcast_id = 1
+
+    async def connect(self):
+        return
+
+    async def close(self):
+        return
+
+    def metrics(self) -> Dict[str, Any]:
+        """Table sizes"""
+        return {
+            "backend": self.name,
+            "users": len(self.users),
+            "files": len(self.files),
+            "broadcasts": len(self.broadcasts),
+            "delivery_progress": len(self.delivery_progress),
+        }
+
+    async def watch_bans(self, apply: Callable[[int, bool], None], reload: Callable[[], Awaitable[None]]):
+        """Nothing to watch, bans only change through this process"""
+        return
+
+    async def hold_leadership(self, on_change: Callable[[bool], Awaitable[None]]):
+        """Nothing is shared with other processes, so this one always leads"""
+        await on_change(True)
+
+    def _user(self, user_id: int) -> Dict:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = _new_user(user_id)
+            bisect.insort(self._user_ids, user_id)
+        return user
+
+    async def upsert_users(self, rows: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+        """Insert or refresh users"""
+        now = datetime.now()
+        for user_id, username, first_name, last_name in rows:
+            self._user(user_id).update(
+                username=username, first_name=first_name, last_name=last_name,
+                delivery_status=None, last_seen_at=now
+            )
+
+    async def set_delivery_outcomes(self, outcomes: List[Tuple[int, str]]):
+        """Record the last failed delivery outcome of each user"""
+        now = datetime.now()
+        for user_id, status in outcomes:
+            user = self.users.get(user_id)
+            if user:
+                user.update(delivery_status=status, delivery_checked_at=now)
+
+    async def get_delivery_status_counts(self) -> Dict[str, int]:
+        """Count users by last failed delivery outcome"""
+        counts: Dict[str, int] = {}
+        for user in self.users.values():
+            if user['delivery_status'] is not None:
+                counts[user['delivery_status']] = counts.get(user['delivery_status'], 0) + 1
+        return counts
+
+    async def purge_dead_users(self) -> int:
+        """Delete users who blocked the bot or deleted their account; bans are kept"""
+        dead = [user_id for user_id, user in self.users.items()
+                if user['delivery_status'] in DEAD_STATUSES and not user['is_banned']]
+        for user_id in dead:
+            del self.users[user_id]
+        if dead:
+            self._user_ids = sorted(self.users)
+        return len(dead)
+
+    async def get_reachable_users_count(self) -> int:
+        """Count users not known to be permanently unreachable"""
+        return sum(1 for user in self.users.values() if _reachable(user))
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get user by ID"""
+        user = self.users.get(user_id)
+        return dict(user) if user else None
+
+    async def set_user_banned(self, user_id: int, banned: bool):
+        """Set a user's ban flag"""
+        if banned:
+            self._user(user_id)['is_banned'] = True
+        elif user_id in self.users:
+            self.users[user_id]['is_banned'] = False
+
+    async def get_banned_ids(self) -> Set[int]:
+        """Ids of every banned user"""
+        return {user_id for user_id, user in self.users.items() if user['is_banned']}
+
+    async def get_banned_users(self) -> List[Dict]:
+        """Get all banned users"""
+        return [dict(user) for user in self.users.values() if user['is_banned']]
+
+    async def get_all_users(self) -> List[Dict]:
+        """Get all users"""
+        return [dict(user) for user in self.users.values()]
+
+    async def get_user_page(self, columns: List[str], after: int, limit: int,
+                            banned: Optional[bool], reachable: bool) -> List[Dict]:
+        """One keyset page of users after the given user_id"""
+        page = []
+        index = bisect.bisect_right(self._user_ids, after)
+        while index < len(self._user_ids) and len(page) < limit:
+            user = self.users[self._user_ids[index]]
+            index += 1
+            if banned is not None and user['is_banned'] != banned:
+                continue
+            if reachable and not _reachable(user):
+                continue
+            page.append({column: user[column] for column in columns})
+        return page
+
+    async def get_users_count(self) -> int:
+        """Get total users count"""
+        return len(self.users)
+
+    async def get_banned_count(self) -> int:
+        """Get banned users count"""
+        return sum(1 for user in self.users.values() if user['is_banned'])
+
+    async def get_stats(self, active_days: int, signup_days: int) -> Dict[str, int]:
+        """User counts from one pass over the users"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        recent = today - timedelta(days=signup_days - 1)
+        active = today - timedelta(days=active_days - 1)
+        stats = dict.fromkeys(('total_users', 'banned_users', 'signups_today', 'signups_recent', 'active_users'), 0)
+        for user in self.users.values():
+            stats['total_users'] += 1
+            stats['banned_users'] += user['is_banned']
+            stats['signups_today'] += user['created_at'] >= today
+            stats['signups_recent'] += user['created_at'] >= recent
+            stats['active_users'] += bool(user['last_seen_at'] and user['last_seen_at'] >= active)
+        return stats
+
+    async def create_broadcast(self, from_chat_id: int, message_id: int, total: int,
+                               status_chat_id: int = None, status_message_id: int = None) -> int:
+        """Create a running broadcast job"""
+        broadcast_id = self._next_broadcast_id
+        self._next_broadcast_id += 1
+        now = datetime.now()
+        self.broadcasts[broadcast_id] = {
+            'broadcast_id': broadcast_id, 'from_chat_id': from_chat_id, 'message_id': message_id,
+            'status': 'running', 'last_user_id': 0, 'total': total, 'success': 0, 'failed': 0,
+            'status_chat_id': status_chat_id, 'status_message_id': status_message_id,
+            'created_at': now, 'updated_at': now,
+        }
+        return broadcast_id
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Get broadcast job by ID"""
+        job = self.broadcasts.get(broadcast_id)
+        return dict(job) if job else None
+
+    async def get_broadcasts(self, status: str) -> List[Dict]:
+        """Get broadcast jobs with the given status"""
+        return [dict(job) for _, job in sorted(self.broadcasts.items()) if job['status'] == status]
+
+    async def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, success: int, failed: int):
+        """Save broadcast progress after a page of recipients"""
+        job = self.broadcasts.get(broadcast_id)
+        if job:
+            job.update(last_user_id=last_user_id, success=success, failed=failed, updated_at=datetime.now())
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        """Set broadcast job status"""
+        job = self.broadcasts.get(broadcast_id)
+        if job:
+            job.update(status=status, updated_at=datetime.now())
+
+    async def add_admin(self, admin_id: int):
+        """Add admin"""
+        self.admins.setdefault(admin_id, datetime.now())
+
+    async def remove_admin(self, admin_id: int):
+        """Remove admin"""
+        self.admins.pop(admin_id, None)
+
+    async def is_admin(self, admin_id: int) -> bool:
+        """Check if user is admin"""
+        return admin_id in self.admins
+
+    async def get_all_admins(self) -> List[int]:
+        """Get all admins"""
+        return list(self.admins)
+
+    async def add_force_sub_channel(self, channel_id: int, channel_username: str = None):
+        """Add force subscribe channel"""
+        channel = self.force_sub_channels.setdefault(channel_id, {'channel_id': channel_id, 'added_at': datetime.now()})
+        channel['channel_username'] = channel_username
+
+    async def remove_force_sub_channel(self, channel_id: int):
+        """Remove force subscribe channel"""
+        self.force_sub_channels.pop(channel_id, None)
+
+    async def get_force_sub_channels(self) -> List[Dict]:
+        """Get all force subscribe channels"""
+        return [dict(channel) for channel in self.force_sub_channels.values()]
+
+    async def add_files(self, records: List[Dict]):
+        """Add or update catalog records"""
+        for record in records:
+            key = (record['channel'], record['message_id'])
+            previous = self.files.get(key)
+            if previous and previous['file_unique_id']:
+                self._files_by_unique_id[previous['file_unique_id']].discard(key)
+            self.files[key] = dict(record)
+            if record['file_unique_id']:
+                self._files_by_unique_id.setdefault(record['file_unique_id'], set()).add(key)
+
+    async def get_files_range(self, first_id: int, last_id: int, channel: int = 0) -> Dict[int, Dict]:
+        """Get one channel's catalog records between two message ids (inclusive), keyed by message id"""
+        first, last = min(first_id, last_id), max(first_id, last_id)
+        if last - first < len(self.files):
+            return {i: dict(self.files[channel, i]) for i in range(first, last + 1) if (channel, i) in self.files}
+        return {i: dict(record) for (c, i), record in self.files.items() if c == channel and first <= i <= last}
+
+    async def find_files_by_unique_id(self, unique_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Earliest stored (channel, message_id) of each file_unique_id found in the catalog"""
+        found = {}
+        for unique_id in unique_ids:
+            keys = self._files_by_unique_id.get(unique_id)
+            if keys:
+                found[unique_id] = min(keys)
+        return found
+
+    async def get_delivery_progress(self, user_id: int, batch_key: str) -> Optional[int]:
+        """Get the next offset to deliver for a user's batch link"""
+        return self.delivery_progress.get((user_id, batch_key))
+
+    async def set_delivery_progress(self, user_id: int, batch_key: str, next_offset: int):
+        """Save the next offset to deliver for a user's batch link"""
+        self.delivery_progress[(user_id, batch_key)] = next_offset
+
+    async def clear_delivery_progress(self, user_id: int, batch_key: str):
+        """Forget a user's position in a fully delivered batch link"""
+        self.delivery_progress.pop((user_id, batch_key), None)
+
+    async def schedule_deletions(self, rows: List[Tuple[int, int, datetime]]):
+        """Queue (chat_id, message_id, due_at) messages for auto-delete"""
+        for chat_id, message_id, due_at in rows:
+            self.scheduled_deletions[(chat_id, message_id)] = due_at
+
+    async def get_scheduled_deletions(self, due_before: datetime = None) -> List[Tuple[int, int, datetime]]:
+        """Queued deletions as (chat_id, message_id, due_at), soonest first; only those due by due_before if given"""
+        return sorted(
+            ((*key, due_at) for key, due_at in self.scheduled_deletions.items()
+             if due_before is None or due_at <= due_before),
+            key=lambda row: row[2]
+        )
+
+    async def remove_deletions(self, keys: List[Tuple[int, int]]):
+        """Drop (chat_id, message_id) entries from the deletion queue"""
+        for key in keys:
+            self.scheduled_deletions.pop(tuple(key), None)
+
+    async def set_setting(self, key: str, value: str):
+        """Set bot setting"""
+        self.settings[key] = value
+
+    async def get_setting(self, key: str) -> Optional[str]:
+        """Get bot setting"""
+        return self.settings.get(key)
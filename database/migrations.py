@@ -0,0 +1,298 @@
+import asyncpg
+from database.backend import REACHABLE_USERS_SQL
+
+# Session advisory lock held while migrating, so concurrent boots don't race
+MIGRATION_LOCK_ID = 7310001
+
+# Ordered schema steps: (version, description, statements). Each step runs in
+# its own transaction and is recorded in schema_version. Never edit a step
+# that has shipped, append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            is_banned BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS admins (
+            admin_id BIGINT PRIMARY KEY,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS force_subscribe_channels (
+            channel_id BIGINT PRIMARY KEY,
+            channel_username VARCHAR(255),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key VARCHAR(255) PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    # Notify other processes whenever a user's ban flag changes
+    (2, "ban notify trigger", [
+        '''
+        CREATE OR REPLACE FUNCTION notify_user_ban() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.is_banned THEN
+                    PERFORM pg_notify('user_bans', NEW.user_id::text || ':1');
+                END IF;
+            ELSIF NEW.is_banned IS DISTINCT FROM OLD.is_banned THEN
+                PERFORM pg_notify('user_bans', NEW.user_id::text || CASE WHEN NEW.is_banned THEN ':1' ELSE ':0' END);
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS users_ban_notify ON users',
+        '''
+        CREATE TRIGGER users_ban_notify
+        AFTER INSERT OR UPDATE OF is_banned ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_user_ban()
+        ''',
+    ]),
+    # Catalog of storage channel messages, so links resolve without Telegram reads
+    (3, "file catalog", [
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            message_id BIGINT PRIMARY KEY,
+            media_type VARCHAR(32) NOT NULL,
+            file_id TEXT,
+            file_unique_id VARCHAR(255),
+            file_name TEXT,
+            file_size BIGINT,
+            mime_type VARCHAR(255),
+            caption TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    # Per-user position in batch links, so interrupted deliveries resume
+    (4, "delivery progress", [
+        '''
+        CREATE TABLE IF NOT EXISTS delivery_progress (
+            user_id BIGINT NOT NULL,
+            batch_key VARCHAR(64) NOT NULL,
+            next_offset BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, batch_key)
+        )
+        ''',
+    ]),
+    # Broadcast jobs; last_user_id is the keyset checkpoint to resume from
+    (5, "broadcast jobs", [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id SERIAL PRIMARY KEY,
+            from_chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            total BIGINT NOT NULL DEFAULT 0,
+            success BIGINT NOT NULL DEFAULT 0,
+            failed BIGINT NOT NULL DEFAULT 0,
+            status_chat_id BIGINT,
+            status_message_id BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    # Last failed delivery outcome (blocked, deactivated, flood, other) and last /start
+    (6, "user delivery status and activity", [
+        'ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_status VARCHAR(16)',
+        'ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_checked_at TIMESTAMP',
+        'ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP',
+    ]),
+    # Counters kept current by a trigger, so stats never scan users. The
+    # trigger creation locks users against writes, so the seed is exact.
+    (7, "stats counters", [
+        '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name VARCHAR(64) PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_signups (
+            day DATE PRIMARY KEY,
+            count BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION maintain_user_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+                IF NEW.is_banned THEN
+                    UPDATE stats_counters SET value = value + 1 WHERE name = 'banned_users';
+                END IF;
+                INSERT INTO daily_signups (day, count) VALUES (CURRENT_DATE, 1)
+                ON CONFLICT (day) DO UPDATE SET count = daily_signups.count + 1;
+                RETURN NEW;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+                IF OLD.is_banned THEN
+                    UPDATE stats_counters SET value = value - 1 WHERE name = 'banned_users';
+                END IF;
+                RETURN OLD;
+            ELSIF NEW.is_banned IS DISTINCT FROM OLD.is_banned THEN
+                UPDATE stats_counters
+                SET value = value + CASE WHEN NEW.is_banned THEN 1 ELSE -1 END
+                WHERE name = 'banned_users';
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS users_counters ON users',
+        '''
+        CREATE TRIGGER users_counters
+        AFTER INSERT OR DELETE OR UPDATE OF is_banned ON users
+        FOR EACH ROW EXECUTE FUNCTION maintain_user_counters()
+        ''',
+        '''
+        INSERT INTO stats_counters (name, value)
+        SELECT 'total_users', COUNT(*) FROM users
+        UNION ALL
+        SELECT 'banned_users', COUNT(*) FROM users WHERE is_banned
+        ON CONFLICT (name) DO NOTHING
+        ''',
+        '''
+        INSERT INTO daily_signups (day, count)
+        SELECT created_at::date, COUNT(*) FROM users WHERE created_at IS NOT NULL GROUP BY 1
+        ON CONFLICT (day) DO NOTHING
+        ''',
+    ]),
+    # Indexes for the hot paths: ban reloads, broadcast keyset pages, activity
+    # counts, dead-user reports, running-job lookups and catalog dedup lookups
+    (8, "hot path indexes", [
+        'CREATE INDEX IF NOT EXISTS users_banned_idx ON users (user_id) WHERE is_banned',
+        f'CREATE INDEX IF NOT EXISTS users_reachable_idx ON users (user_id) WHERE {REACHABLE_USERS_SQL}',
+        'CREATE INDEX IF NOT EXISTS users_last_seen_idx ON users (last_seen_at)',
+        'CREATE INDEX IF NOT EXISTS users_delivery_status_idx ON users (delivery_status) WHERE delivery_status IS NOT NULL',
+        "CREATE INDEX IF NOT EXISTS broadcasts_running_idx ON broadcasts (broadcast_id) WHERE status = 'running'",
+        'CREATE INDEX IF NOT EXISTS files_unique_id_idx ON files (file_unique_id)',
+    ]),
+    # Delivered messages waiting for auto-delete, drained in due_at order
+    (9, "scheduled deletions", [
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_deletions (
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            due_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS scheduled_deletions_due_idx ON scheduled_deletions (due_at)',
+    ]),
+    # Files live in several storage channels, message ids only unique within one;
+    # existing rows are all in channel 0, CHANNEL_ID
+    (10, "storage channels", [
+        'ALTER TABLE files ADD COLUMN IF NOT EXISTS channel SMALLINT NOT NULL DEFAULT 0',
+        'ALTER TABLE files DROP CONSTRAINT IF EXISTS files_pkey',
+        'ALTER TABLE files ADD PRIMARY KEY (channel, message_id)',
+    ]),
+    # Users per day of their last visit, so active users are summed from a few
+    # rows instead of counted; a user moves between days only on their first
+    # visit of a new day. Seeded under the trigger's lock like migration 7.
+    (11, "daily activity counters", [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_active (
+            day DATE PRIMARY KEY,
+            count BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION maintain_user_activity() RETURNS trigger AS $$
+        DECLARE
+            old_day DATE;
+            new_day DATE;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                old_day := OLD.last_seen_at::date;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                new_day := NEW.last_seen_at::date;
+            END IF;
+            IF old_day IS NOT DISTINCT FROM new_day THEN
+                RETURN NULL;
+            END IF;
+            IF old_day IS NOT NULL THEN
+                UPDATE daily_active SET count = count - 1 WHERE day = old_day;
+            END IF;
+            IF new_day IS NOT NULL THEN
+                INSERT INTO daily_active (day, count) VALUES (new_day, 1)
+                ON CONFLICT (day) DO UPDATE SET count = daily_active.count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS users_activity ON users',
+        '''
+        CREATE TRIGGER users_activity
+        AFTER INSERT OR DELETE OR UPDATE OF last_seen_at ON users
+        FOR EACH ROW EXECUTE FUNCTION maintain_user_activity()
+        ''',
+        '''
+        INSERT INTO daily_active (day, count)
+        SELECT last_seen_at::date, COUNT(*) FROM users WHERE last_seen_at IS NOT NULL GROUP BY 1
+        ON CONFLICT (day) DO NOTHING
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version(conn: asyncpg.Connection) -> int:
+    """Current schema version, 0 when no migration ever ran"""
+    if not await conn.fetchval("SELECT to_regclass('schema_version') IS NOT NULL"):
+        return 0
+    return await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+
+async def run_migrations(conn: asyncpg.Connection, logger) -> int:
+    """Apply pending migrations; returns the number applied"""
+    # Fast path: a current schema costs two reads and no DDL
+    if await get_schema_version(conn) >= LATEST_VERSION:
+        return 0
+
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Re-read under the lock, another process may have migrated meanwhile
+        current = await get_schema_version(conn)
+        applied = 0
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            async with conn.transaction():
+                for statement in statements:
+                    await conn.execute(statement)
+                await conn.execute(
+                    'INSERT INTO schema_version (version, description) VALUES ($1, $2)',
+                    version, description
+                )
+            logger.info(f"Applied migration {version}: {description}")
+            applied += 1
+        return applied
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
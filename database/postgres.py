@@ -0,0 +1,523 @@
+import time
+import asyncio
+import asyncpg
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, Awaitable
+from database.backend import REACHABLE_USERS_SQL, DEAD_STATUSES, LatencyStats
+from database.migrations import run_migrations, LATEST_VERSION
+from config import LOGGER
+from config import (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_STATEMENT_CACHE_SIZE, DB_ACQUIRE_TIMEOUT,
+                    DB_CONN_MAX_QUERIES, DB_CONN_MAX_IDLE)
+
+UPSERT_USER_SQL = '''
+    INSERT INTO users (user_id, username, first_name, last_name, last_seen_at)
+    VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET
+    username = $2, first_name = $3, last_name = $4, delivery_status = NULL,
+    last_seen_at = CURRENT_TIMESTAMP
+'''
+
+GET_FILES_RANGE_SQL = '''
+    SELECT channel, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption
+    FROM files WHERE channel = $3 AND message_id BETWEEN $1 AND $2
+'''
+GET_DELIVERY_PROGRESS_SQL = 'SELECT next_offset FROM delivery_progress WHERE user_id = $1 AND batch_key = $2'
+GET_BROADCAST_SQL = 'SELECT * FROM broadcasts WHERE broadcast_id = $1'
+GET_SETTING_SQL = 'SELECT value FROM bot_settings WHERE key = $1'
+# Largest BIGINT, a keyset start that matches no user
+MAX_USER_ID = 2 ** 63 - 1
+
+# Channel the users trigger notifies with "<user_id>:<0|1>" on ban changes
+BAN_NOTIFY_CHANNEL = "user_bans"
+# Seconds between liveness probes on the idle LISTEN connection
+BAN_LISTENER_PING_INTERVAL = 60
+# Session advisory lock held by the leader process; released when its connection ends
+LEADER_LOCK_KEY = 0x46534C44
+# Seconds between liveness probes on the connection holding the leader lock
+LEADER_PING_INTERVAL = 10
+
+def user_page_query(columns: List[str], banned: Optional[bool], reachable: bool) -> str:
+    """Keyset page query over users: $1 is the last seen user_id, $2 the page size"""
+    conditions = ['user_id > $1']
+    if banned is not None:
+        conditions.append('is_banned' if banned else 'NOT is_banned')
+    if reachable:
+        conditions.append(REACHABLE_USERS_SQL)
+    return f"SELECT {', '.join(columns)} FROM users WHERE {' AND '.join(conditions)} ORDER BY user_id LIMIT $2"
+
+# Read queries on the hot path with arguments that match no rows. Running each
+# once on a new connection prepares it into that connection's statement cache,
+# so the first real request doesn't pay for parsing and planning.
+HOT_QUERIES = [
+    (GET_FILES_RANGE_SQL, (1, 0, 0)),
+    (GET_DELIVERY_PROGRESS_SQL, (0, '')),
+    (GET_BROADCAST_SQL, (0,)),
+    (GET_SETTING_SQL, ('',)),
+    (user_page_query(['user_id'], None, True), (MAX_USER_ID, 0)),
+    (user_page_query(['user_id'], None, False), (MAX_USER_ID, 0)),
+]
+
+class PostgresBackend:
+    """PostgreSQL storage over an asyncpg pool"""
+
+    name = "postgres"
+
+    def __init__(self, db_url: Optional[str]):
+        self.pool = None
+        self.db_url = db_url
+        self.logger = LOGGER(__name__)
+        # Hot queries are only prepared once migrations brought the schema up to date
+        self.schema_ready = False
+
+        # Pool metrics
+        self.acquire_wait = LatencyStats()
+        self.query_time = LatencyStats()
+        self.acquire_timeouts = 0
+        self.waiting = 0
+
+    async def connect(self):
+        """Create the connection pool and bring the schema up to date"""
+        self.pool = await asyncpg.create_pool(
+            self.db_url,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_queries=DB_CONN_MAX_QUERIES,
+            max_inactive_connection_lifetime=DB_CONN_MAX_IDLE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            init=self._init_connection
+        )
+        await self.create_tables()
+        self.schema_ready = True
+        # Connections opened before the migrations reconnect on next use, preparing the hot queries
+        await self.pool.expire_connections()
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def _init_connection(self, conn: asyncpg.Connection):
+        """Prepare the hot queries on every new pool connection"""
+        if not DB_STATEMENT_CACHE_SIZE or not self.schema_ready:
+            return
+        for query, args in HOT_QUERIES:
+            try:
+                await conn.fetch(query, *args)
+            except asyncpg.PostgresError as e:
+                # A cold statement is only slower, never worth failing the connection over
+                self.logger.warning(f"Failed to prepare hot query: {e}")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Pool connection, recording acquire wait and hold time"""
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        acquired = time.perf_counter()
+        self.acquire_wait.record(acquired - started)
+        try:
+            yield conn
+        finally:
+            self.query_time.record(time.perf_counter() - acquired)
+            await self.pool.release(conn)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool utilization and latency metrics"""
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+        return {
+            "backend": self.name,
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "max_size": DB_POOL_MAX_SIZE,
+            "utilization": (size - idle) / DB_POOL_MAX_SIZE if DB_POOL_MAX_SIZE else 0.0,
+            "waiting": self.waiting,
+            "acquires": self.acquire_wait.count,
+            "acquire_wait_mean": self.acquire_wait.mean,
+            "acquire_wait_max": self.acquire_wait.max,
+            "acquire_timeouts": self.acquire_timeouts,
+            "query_time_mean": self.query_time.mean,
+            "query_time_max": self.query_time.max,
+        }
+
+    async def create_tables(self):
+        """Bring the schema up to date, skipping all DDL when it already is"""
+        async with self.acquire() as conn:
+            applied = await run_migrations(conn, self.logger)
+        if applied:
+            self.logger.info(f"Database schema migrated to version {LATEST_VERSION}")
+
+    async def watch_bans(self, apply: Callable[[int, bool], None], reload: Callable[[], Awaitable[None]]):
+        """Hold a LISTEN connection for ban changes, reloading after every (re)connect"""
+        def on_notify(connection, pid, channel, payload):
+            try:
+                user_id, banned = payload.split(":")
+                apply(int(user_id), banned == "1")
+            except ValueError:
+                self.logger.warning(f"Ignoring malformed ban notification: {payload}")
+
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.db_url)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(BAN_NOTIFY_CHANNEL, on_notify)
+                # Reload after LISTEN so no change between the two is missed
+                await reload()
+                delay = 1
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), BAN_LISTENER_PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await conn.execute('SELECT 1')
+                self.logger.warning("Ban listener connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Ban listener error: {e}")
+            finally:
+                if conn and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def hold_leadership(self, on_change: Callable[[bool], Awaitable[None]]):
+        """Compete for the leader advisory lock on a dedicated connection.
+
+        on_change(False) runs when another process already leads, and
+        on_change(True) once the lock is taken. Postgres releases the lock
+        when the leader's session ends, so a waiting process takes over when
+        the leader dies; a leader that loses its connection steps down with
+        on_change(False) before competing again.
+        """
+        delay = 1
+        while True:
+            conn = None
+            leader = False
+            try:
+                conn = await asyncpg.connect(self.db_url)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                if not await conn.fetchval('SELECT pg_try_advisory_lock($1)', LEADER_LOCK_KEY):
+                    await on_change(False)
+                    # Blocks until the current leader's session ends
+                    await conn.execute('SELECT pg_advisory_lock($1)', LEADER_LOCK_KEY)
+                leader = True
+                await on_change(True)
+                delay = 1
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), LEADER_PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        # A hung probe counts as lost, so a partitioned leader steps down
+                        await asyncio.wait_for(conn.execute('SELECT 1'), LEADER_PING_INTERVAL)
+                self.logger.warning("Leader lock connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Leader election error: {e}")
+            finally:
+                if conn and not conn.is_closed():
+                    conn.terminate()
+                if leader:
+                    await on_change(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def upsert_users(self, rows: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+        """Insert or refresh users in a single executemany"""
+        async with self.acquire() as conn:
+            await conn.executemany(UPSERT_USER_SQL, rows)
+
+    async def set_delivery_outcomes(self, outcomes: List[Tuple[int, str]]):
+        """Record the last failed delivery outcome of each user"""
+        async with self.acquire() as conn:
+            await conn.executemany('''
+                UPDATE users SET delivery_status = $2, delivery_checked_at = CURRENT_TIMESTAMP
+                WHERE user_id = $1
+            ''', outcomes)
+
+    async def get_delivery_status_counts(self) -> Dict[str, int]:
+        """Count users by last failed delivery outcome"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT delivery_status, COUNT(*) AS count FROM users
+                WHERE delivery_status IS NOT NULL GROUP BY delivery_status
+            ''')
+            return {row['delivery_status']: row['count'] for row in rows}
+
+    async def purge_dead_users(self) -> int:
+        """Delete users who blocked the bot or deleted their account; bans are kept"""
+        async with self.acquire() as conn:
+            result = await conn.execute(
+                'DELETE FROM users WHERE delivery_status = ANY($1::varchar[]) AND NOT is_banned',
+                list(DEAD_STATUSES)
+            )
+            return int(result.split()[-1])
+
+    async def get_reachable_users_count(self) -> int:
+        """Count users not known to be permanently unreachable"""
+        async with self.acquire() as conn:
+            return await conn.fetchval(f'SELECT COUNT(*) FROM users WHERE {REACHABLE_USERS_SQL}')
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get user by ID"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
+            return dict(row) if row else None
+
+    async def set_user_banned(self, user_id: int, banned: bool):
+        """Set a user's ban flag"""
+        async with self.acquire() as conn:
+            if banned:
+                # Upsert so users still sitting in the write-behind queue can be banned too
+                await conn.execute('''
+                    INSERT INTO users (user_id, is_banned) VALUES ($1, TRUE)
+                    ON CONFLICT (user_id) DO UPDATE SET is_banned = TRUE
+                ''', user_id)
+            else:
+                await conn.execute('UPDATE users SET is_banned = FALSE WHERE user_id = $1', user_id)
+
+    async def get_banned_ids(self) -> Set[int]:
+        """Ids of every banned user"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT user_id FROM users WHERE is_banned = TRUE')
+        return {row['user_id'] for row in rows}
+
+    async def get_banned_users(self) -> List[Dict]:
+        """Get all banned users"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT * FROM users WHERE is_banned = TRUE')
+            return [dict(row) for row in rows]
+
+    async def get_all_users(self) -> List[Dict]:
+        """Get all users"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT * FROM users')
+            return [dict(row) for row in rows]
+
+    async def get_user_page(self, columns: List[str], after: int, limit: int,
+                            banned: Optional[bool], reachable: bool) -> List[asyncpg.Record]:
+        """One keyset page of users after the given user_id"""
+        async with self.acquire() as conn:
+            return await conn.fetch(user_page_query(columns, banned, reachable), after, limit)
+
+    async def get_users_count(self) -> int:
+        """Get total users count"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow('SELECT COUNT(*) as count FROM users')
+            return row['count']
+
+    async def get_banned_count(self) -> int:
+        """Get banned users count"""
+        async with self.acquire() as conn:
+            return await conn.fetchval('SELECT COUNT(*) FROM users WHERE is_banned')
+
+    async def get_stats(self, active_days: int, signup_days: int) -> Dict[str, int]:
+        """User counts from the trigger-maintained counters tables"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    (SELECT value FROM stats_counters WHERE name = 'total_users') AS total_users,
+                    (SELECT value FROM stats_counters WHERE name = 'banned_users') AS banned_users,
+                    (SELECT COALESCE(SUM(count), 0) FROM daily_signups WHERE day = CURRENT_DATE) AS signups_today,
+                    (SELECT COALESCE(SUM(count), 0) FROM daily_signups WHERE day > CURRENT_DATE - $2::int) AS signups_recent,
+                    (SELECT COALESCE(SUM(count), 0) FROM daily_active WHERE day > CURRENT_DATE - $1::int) AS active_users
+            ''', active_days, signup_days)
+        return {key: value or 0 for key, value in row.items()}
+
+    async def create_broadcast(self, from_chat_id: int, message_id: int, total: int,
+                               status_chat_id: int = None, status_message_id: int = None) -> int:
+        """Create a running broadcast job"""
+        async with self.acquire() as conn:
+            return await conn.fetchval('''
+                INSERT INTO broadcasts (from_chat_id, message_id, total, status_chat_id, status_message_id)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING broadcast_id
+            ''', from_chat_id, message_id, total, status_chat_id, status_message_id)
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Get broadcast job by ID"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow(GET_BROADCAST_SQL, broadcast_id)
+            return dict(row) if row else None
+
+    async def get_broadcasts(self, status: str) -> List[Dict]:
+        """Get broadcast jobs with the given status"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT * FROM broadcasts WHERE status = $1 ORDER BY broadcast_id', status)
+            return [dict(row) for row in rows]
+
+    async def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, success: int, failed: int):
+        """Save broadcast progress after a page of recipients"""
+        async with self.acquire() as conn:
+            await conn.execute('''
+                UPDATE broadcasts SET last_user_id = $2, success = $3, failed = $4, updated_at = CURRENT_TIMESTAMP
+                WHERE broadcast_id = $1
+            ''', broadcast_id, last_user_id, success, failed)
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        """Set broadcast job status"""
+        async with self.acquire() as conn:
+            await conn.execute(
+                'UPDATE broadcasts SET status = $2, updated_at = CURRENT_TIMESTAMP WHERE broadcast_id = $1',
+                broadcast_id, status
+            )
+
+    async def add_admin(self, admin_id: int):
+        """Add admin"""
+        async with self.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO admins (admin_id) VALUES ($1)
+                ON CONFLICT (admin_id) DO NOTHING
+            ''', admin_id)
+
+    async def remove_admin(self, admin_id: int):
+        """Remove admin"""
+        async with self.acquire() as conn:
+            await conn.execute('DELETE FROM admins WHERE admin_id = $1', admin_id)
+
+    async def is_admin(self, admin_id: int) -> bool:
+        """Check if user is admin"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow('SELECT admin_id FROM admins WHERE admin_id = $1', admin_id)
+            return bool(row)
+
+    async def get_all_admins(self) -> List[int]:
+        """Get all admins"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT admin_id FROM admins')
+            return [row['admin_id'] for row in rows]
+
+    async def add_force_sub_channel(self, channel_id: int, channel_username: str = None):
+        """Add force subscribe channel"""
+        async with self.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO force_subscribe_channels (channel_id, channel_username)
+                VALUES ($1, $2)
+                ON CONFLICT (channel_id) DO UPDATE SET channel_username = $2
+            ''', channel_id, channel_username)
+
+    async def remove_force_sub_channel(self, channel_id: int):
+        """Remove force subscribe channel"""
+        async with self.acquire() as conn:
+            await conn.execute('DELETE FROM force_subscribe_channels WHERE channel_id = $1', channel_id)
+
+    async def get_force_sub_channels(self) -> List[Dict]:
+        """Get all force subscribe channels"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('SELECT * FROM force_subscribe_channels')
+            return [dict(row) for row in rows]
+
+    async def add_files(self, records: List[Dict]):
+        """Add or update catalog records"""
+        if not records:
+            return
+        async with self.acquire() as conn:
+            await conn.executemany('''
+                INSERT INTO files (channel, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                ON CONFLICT (channel, message_id) DO UPDATE SET
+                media_type = $3, file_id = $4, file_unique_id = $5, file_name = $6,
+                file_size = $7, mime_type = $8, caption = $9
+            ''', [
+                (r['channel'], r['message_id'], r['media_type'], r['file_id'], r['file_unique_id'],
+                 r['file_name'], r['file_size'], r['mime_type'], r['caption'])
+                for r in records
+            ])
+
+    async def get_files_range(self, first_id: int, last_id: int, channel: int = 0) -> Dict[int, Dict]:
+        """Get one channel's catalog records between two message ids (inclusive), keyed by message id"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch(GET_FILES_RANGE_SQL, min(first_id, last_id), max(first_id, last_id), channel)
+            return {row['message_id']: dict(row) for row in rows}
+
+    async def find_files_by_unique_id(self, unique_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Earliest stored (channel, message_id) of each file_unique_id found in the catalog"""
+        if not unique_ids:
+            return {}
+        async with self.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT DISTINCT ON (file_unique_id) file_unique_id, channel, message_id FROM files
+                WHERE file_unique_id = ANY($1::varchar[]) ORDER BY file_unique_id, channel, message_id
+            ''', list(unique_ids))
+            return {row['file_unique_id']: (row['channel'], row['message_id']) for row in rows}
+
+    async def get_delivery_progress(self, user_id: int, batch_key: str) -> Optional[int]:
+        """Get the next offset to deliver for a user's batch link"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow(GET_DELIVERY_PROGRESS_SQL, user_id, batch_key)
+            return row['next_offset'] if row else None
+
+    async def set_delivery_progress(self, user_id: int, batch_key: str, next_offset: int):
+        """Save the next offset to deliver for a user's batch link"""
+        async with self.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO delivery_progress (user_id, batch_key, next_offset)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (user_id, batch_key) DO UPDATE SET
+                next_offset = $3, updated_at = CURRENT_TIMESTAMP
+            ''', user_id, batch_key, next_offset)
+
+    async def clear_delivery_progress(self, user_id: int, batch_key: str):
+        """Forget a user's position in a fully delivered batch link"""
+        async with self.acquire() as conn:
+            await conn.execute(
+                'DELETE FROM delivery_progress WHERE user_id = $1 AND batch_key = $2',
+                user_id, batch_key
+            )
+
+    async def schedule_deletions(self, rows: List[Tuple[int, int, datetime]]):
+        """Queue (chat_id, message_id, due_at) messages for auto-delete"""
+        if not rows:
+            return
+        async with self.acquire() as conn:
+            await conn.executemany('''
+                INSERT INTO scheduled_deletions (chat_id, message_id, due_at) VALUES ($1, $2, $3)
+                ON CONFLICT (chat_id, message_id) DO UPDATE SET due_at = $3
+            ''', rows)
+
+    async def get_scheduled_deletions(self, due_before: datetime = None) -> List[Tuple[int, int, datetime]]:
+        """Queued deletions as (chat_id, message_id, due_at), soonest first; only those due by due_before if given"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT chat_id, message_id, due_at FROM scheduled_deletions
+                WHERE $1::timestamp IS NULL OR due_at <= $1 ORDER BY due_at
+            ''', due_before)
+            return [tuple(row) for row in rows]
+
+    async def remove_deletions(self, keys: List[Tuple[int, int]]):
+        """Drop (chat_id, message_id) entries from the deletion queue"""
+        if not keys:
+            return
+        async with self.acquire() as conn:
+            await conn.execute('''
+                DELETE FROM scheduled_deletions d
+                USING unnest($1::bigint[], $2::bigint[]) AS k(chat_id, message_id)
+                WHERE d.chat_id = k.chat_id AND d.message_id = k.message_id
+            ''', [chat_id for chat_id, _ in keys], [message_id for _, message_id in keys])
+
+    async def set_setting(self, key: str, value: str):
+        """Set bot setting"""
+        async with self.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO bot_settings (key, value)
+                VALUES ($1, $2)
+                ON CONFLICT (key) DO UPDATE SET value = $2, updated_at = CURRENT_TIMESTAMP
+            ''', key, value)
+
+    async def get_setting(self, key: str) -> Optional[str]:
+        """Get bot setting"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow(GET_SETTING_SQL, key)
+            return row['value'] if row else None
@@ -0,0 +1,566 @@
+import time
+import queue
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, Awaitable
+from database.backend import REACHABLE_USERS_SQL, DEAD_STATUSES, LatencyStats
+from config import LOGGER
+
+# Operations committed together in one write transaction at most
+MAX_BATCH = 256
+
+# Ordered schema steps: (version, description, statements), tracked in
+# PRAGMA user_version. Never edit a step that has shipped, append a new one.
+# Stats are plain COUNTs here, so there are no counter tables or triggers.
+SQLITE_MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            is_banned BOOLEAN NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivery_status TEXT,
+            delivery_checked_at TIMESTAMP,
+            last_seen_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS admins (
+            admin_id INTEGER PRIMARY KEY,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS force_subscribe_channels (
+            channel_id INTEGER PRIMARY KEY,
+            channel_username TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            message_id INTEGER PRIMARY KEY,
+            media_type TEXT NOT NULL,
+            file_id TEXT,
+            file_unique_id TEXT,
+            file_name TEXT,
+            file_size INTEGER,
+            mime_type TEXT,
+            caption TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS delivery_progress (
+            user_id INTEGER NOT NULL,
+            batch_key TEXT NOT NULL,
+            next_offset INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, batch_key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            success INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status_chat_id INTEGER,
+            status_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS users_banned_idx ON users (user_id) WHERE is_banned',
+        f'CREATE INDEX IF NOT EXISTS users_reachable_idx ON users (user_id) WHERE {REACHABLE_USERS_SQL}',
+        'CREATE INDEX IF NOT EXISTS users_last_seen_idx ON users (last_seen_at)',
+        'CREATE INDEX IF NOT EXISTS users_created_idx ON users (created_at)',
+        'CREATE INDEX IF NOT EXISTS users_delivery_status_idx ON users (delivery_status) WHERE delivery_status IS NOT NULL',
+        "CREATE INDEX IF NOT EXISTS broadcasts_running_idx ON broadcasts (broadcast_id) WHERE status = 'running'",
+        'CREATE INDEX IF NOT EXISTS files_unique_id_idx ON files (file_unique_id)',
+    ]),
+    (2, "scheduled deletions", [
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_deletions (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            due_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS scheduled_deletions_due_idx ON scheduled_deletions (due_at)',
+    ]),
+    # SQLite can't change a primary key in place, so the catalog is rebuilt keyed by (channel, message_id)
+    (3, "storage channels", [
+        '''
+        CREATE TABLE files_new (
+            channel INTEGER NOT NULL DEFAULT 0,
+            message_id INTEGER NOT NULL,
+            media_type TEXT NOT NULL,
+            file_id TEXT,
+            file_unique_id TEXT,
+            file_name TEXT,
+            file_size INTEGER,
+            mime_type TEXT,
+            caption TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel, message_id)
+        )
+        ''',
+        '''
+        INSERT INTO files_new (channel, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption, created_at)
+        SELECT 0, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption, created_at FROM files
+        ''',
+        'DROP TABLE files',
+        'ALTER TABLE files_new RENAME TO files',
+        'CREATE INDEX IF NOT EXISTS files_unique_id_idx ON files (file_unique_id)',
+    ]),
+]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending schema steps; returns the number applied"""
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    applied = 0
+    for version, description, statements in SQLITE_MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f'PRAGMA user_version = {version}')
+        applied += 1
+    return applied
+
+def user_page_query(columns: List[str], banned: Optional[bool], reachable: bool) -> str:
+    """Keyset page query over users: the last seen user_id, then the page size"""
+    conditions = ['user_id > ?']
+    if banned is not None:
+        conditions.append('is_banned' if banned else 'NOT is_banned')
+    if reachable:
+        conditions.append(REACHABLE_USERS_SQL)
+    return f"SELECT {', '.join(columns)} FROM users WHERE {' AND '.join(conditions)} ORDER BY user_id LIMIT ?"
+
+def _resolve(future: asyncio.Future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class SQLiteBackend:
+    """Embedded SQLite storage owned by one dedicated thread.
+
+    Every operation is queued to the thread, which drains whatever is
+    waiting into a single write transaction, giving each operation its own
+    savepoint so one failure doesn't undo its neighbours. The database runs
+    in WAL mode with synchronous=NORMAL, so a batch costs one WAL append.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = LOGGER(__name__)
+        self._ops = queue.SimpleQueue()
+        self._thread = None
+        self._loop = None
+
+        # Batch metrics
+        self.batches = 0
+        self.ops = 0
+        self.batch_time = LatencyStats()
+        self.op_latency = LatencyStats()
+
+    async def connect(self):
+        """Open the database, start the writer thread and bring the schema up to date"""
+        self._loop = asyncio.get_running_loop()
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        self._thread = threading.Thread(target=self._writer, args=(conn,), name="sqlite-writer", daemon=True)
+        self._thread.start()
+        applied = await self._call(migrate)
+        if applied:
+            self.logger.info(f"SQLite schema migrated to version {SQLITE_MIGRATIONS[-1][0]}")
+
+    async def close(self):
+        if self._thread:
+            self._ops.put(None)
+            await self._loop.run_in_executor(None, self._thread.join)
+            self._thread = None
+
+    def _writer(self, conn: sqlite3.Connection):
+        """Writer thread: run queued operations in batches until closed"""
+        try:
+            while True:
+                item = self._ops.get()
+                if item is None:
+                    return
+                batch = [item]
+                closing = False
+                while len(batch) < MAX_BATCH:
+                    try:
+                        item = self._ops.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append(item)
+                self._run_batch(conn, batch)
+                if closing:
+                    return
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list):
+        started = time.perf_counter()
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for func, args, future, _ in batch:
+                conn.execute('SAVEPOINT op')
+                try:
+                    result = func(conn, *args)
+                    conn.execute('RELEASE op')
+                    results.append((result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO op')
+                    conn.execute('RELEASE op')
+                    results.append((None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [(None, e)] * len(batch)
+        self.batches += 1
+        self.ops += len(batch)
+        self.batch_time.record(time.perf_counter() - started)
+        for (func, args, future, queued), (result, error) in zip(batch, results):
+            self._loop.call_soon_threadsafe(_resolve, future, result, error)
+
+    async def _call(self, func: Callable, *args):
+        """Run func(conn, *args) on the writer thread and wait for its batch to commit"""
+        queued = time.perf_counter()
+        future = self._loop.create_future()
+        self._ops.put((func, args, future, queued))
+        try:
+            return await future
+        finally:
+            self.op_latency.record(time.perf_counter() - queued)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Writer queue, batching and latency metrics"""
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "queued": self._ops.qsize(),
+            "batches": self.batches,
+            "ops": self.ops,
+            "ops_per_batch": self.ops / self.batches if self.batches else 0.0,
+            "batch_time_mean": self.batch_time.mean,
+            "batch_time_max": self.batch_time.max,
+            "op_latency_mean": self.op_latency.mean,
+            "op_latency_max": self.op_latency.max,
+        }
+
+    async def watch_bans(self, apply: Callable[[int, bool], None], reload: Callable[[], Awaitable[None]]):
+        """Nothing to watch, bans only change through this process"""
+        return
+
+    async def hold_leadership(self, on_change: Callable[[bool], Awaitable[None]]):
+        """The database file belongs to this process, so it always leads"""
+        await on_change(True)
+
+    async def upsert_users(self, rows: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+        """Insert or refresh users"""
+        await self._call(lambda conn: conn.executemany('''
+            INSERT INTO users (user_id, username, first_name, last_name, last_seen_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+            username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name,
+            delivery_status = NULL, last_seen_at = CURRENT_TIMESTAMP
+        ''', rows))
+
+    async def set_delivery_outcomes(self, outcomes: List[Tuple[int, str]]):
+        """Record the last failed delivery outcome of each user"""
+        await self._call(lambda conn: conn.executemany(
+            'UPDATE users SET delivery_status = ?, delivery_checked_at = CURRENT_TIMESTAMP WHERE user_id = ?',
+            [(status, user_id) for user_id, status in outcomes]
+        ))
+
+    async def get_delivery_status_counts(self) -> Dict[str, int]:
+        """Count users by last failed delivery outcome"""
+        rows = await self._call(lambda conn: conn.execute('''
+            SELECT delivery_status, COUNT(*) AS count FROM users
+            WHERE delivery_status IS NOT NULL GROUP BY delivery_status
+        ''').fetchall())
+        return {row['delivery_status']: row['count'] for row in rows}
+
+    async def purge_dead_users(self) -> int:
+        """Delete users who blocked the bot or deleted their account; bans are kept"""
+        placeholders = ', '.join('?' * len(DEAD_STATUSES))
+        return await self._call(lambda conn: conn.execute(
+            f'DELETE FROM users WHERE delivery_status IN ({placeholders}) AND NOT is_banned', DEAD_STATUSES
+        ).rowcount)
+
+    async def get_reachable_users_count(self) -> int:
+        """Count users not known to be permanently unreachable"""
+        return await self._call(lambda conn: conn.execute(
+            f'SELECT COUNT(*) FROM users WHERE {REACHABLE_USERS_SQL}'
+        ).fetchone()[0])
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get user by ID"""
+        row = await self._call(lambda conn: conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone())
+        return dict(row) if row else None
+
+    async def set_user_banned(self, user_id: int, banned: bool):
+        """Set a user's ban flag"""
+        if banned:
+            await self._call(lambda conn: conn.execute('''
+                INSERT INTO users (user_id, is_banned) VALUES (?, 1)
+                ON CONFLICT (user_id) DO UPDATE SET is_banned = 1
+            ''', (user_id,)))
+        else:
+            await self._call(lambda conn: conn.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,)))
+
+    async def get_banned_ids(self) -> Set[int]:
+        """Ids of every banned user"""
+        rows = await self._call(lambda conn: conn.execute('SELECT user_id FROM users WHERE is_banned').fetchall())
+        return {row['user_id'] for row in rows}
+
+    async def get_banned_users(self) -> List[Dict]:
+        """Get all banned users"""
+        rows = await self._call(lambda conn: conn.execute('SELECT * FROM users WHERE is_banned').fetchall())
+        return [dict(row) for row in rows]
+
+    async def get_all_users(self) -> List[Dict]:
+        """Get all users"""
+        rows = await self._call(lambda conn: conn.execute('SELECT * FROM users').fetchall())
+        return [dict(row) for row in rows]
+
+    async def get_user_page(self, columns: List[str], after: int, limit: int,
+                            banned: Optional[bool], reachable: bool) -> List[sqlite3.Row]:
+        """One keyset page of users after the given user_id"""
+        query = user_page_query(columns, banned, reachable)
+        return await self._call(lambda conn: conn.execute(query, (after, limit)).fetchall())
+
+    async def get_users_count(self) -> int:
+        """Get total users count"""
+        return await self._call(lambda conn: conn.execute('SELECT COUNT(*) FROM users').fetchone()[0])
+
+    async def get_banned_count(self) -> int:
+        """Get banned users count"""
+        return await self._call(lambda conn: conn.execute('SELECT COUNT(*) FROM users WHERE is_banned').fetchone()[0])
+
+    async def get_stats(self, active_days: int, signup_days: int) -> Dict[str, int]:
+        """User counts, each answered from an index"""
+        row = await self._call(lambda conn: conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM users) AS total_users,
+                (SELECT COUNT(*) FROM users WHERE is_banned) AS banned_users,
+                (SELECT COUNT(*) FROM users WHERE created_at >= date('now')) AS signups_today,
+                (SELECT COUNT(*) FROM users WHERE created_at >= date('now', ?)) AS signups_recent,
+                (SELECT COUNT(*) FROM users WHERE last_seen_at >= date('now', ?)) AS active_users
+        ''', (f'-{signup_days - 1} days', f'-{active_days - 1} days')).fetchone())
+        return dict(row)
+
+    async def create_broadcast(self, from_chat_id: int, message_id: int, total: int,
+                               status_chat_id: int = None, status_message_id: int = None) -> int:
+        """Create a running broadcast job"""
+        return await self._call(lambda conn: conn.execute('''
+            INSERT INTO broadcasts (from_chat_id, message_id, total, status_chat_id, status_message_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (from_chat_id, message_id, total, status_chat_id, status_message_id)).lastrowid)
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Get broadcast job by ID"""
+        row = await self._call(lambda conn: conn.execute(
+            'SELECT * FROM broadcasts WHERE broadcast_id = ?', (broadcast_id,)
+        ).fetchone())
+        return dict(row) if row else None
+
+    async def get_broadcasts(self, status: str) -> List[Dict]:
+        """Get broadcast jobs with the given status"""
+        rows = await self._call(lambda conn: conn.execute(
+            'SELECT * FROM broadcasts WHERE status = ? ORDER BY broadcast_id', (status,)
+        ).fetchall())
+        return [dict(row) for row in rows]
+
+    async def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, success: int, failed: int):
+        """Save broadcast progress after a page of recipients"""
+        await self._call(lambda conn: conn.execute('''
+            UPDATE broadcasts SET last_user_id = ?, success = ?, failed = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE broadcast_id = ?
+        ''', (last_user_id, success, failed, broadcast_id)))
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        """Set broadcast job status"""
+        await self._call(lambda conn: conn.execute(
+            'UPDATE broadcasts SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE broadcast_id = ?',
+            (status, broadcast_id)
+        ))
+
+    async def add_admin(self, admin_id: int):
+        """Add admin"""
+        await self._call(lambda conn: conn.execute('INSERT OR IGNORE INTO admins (admin_id) VALUES (?)', (admin_id,)))
+
+    async def remove_admin(self, admin_id: int):
+        """Remove admin"""
+        await self._call(lambda conn: conn.execute('DELETE FROM admins WHERE admin_id = ?', (admin_id,)))
+
+    async def is_admin(self, admin_id: int) -> bool:
+        """Check if user is admin"""
+        row = await self._call(lambda conn: conn.execute(
+            'SELECT admin_id FROM admins WHERE admin_id = ?', (admin_id,)
+        ).fetchone())
+        return bool(row)
+
+    async def get_all_admins(self) -> List[int]:
+        """Get all admins"""
+        rows = await self._call(lambda conn: conn.execute('SELECT admin_id FROM admins').fetchall())
+        return [row['admin_id'] for row in rows]
+
+    async def add_force_sub_channel(self, channel_id: int, channel_username: str = None):
+        """Add force subscribe channel"""
+        await self._call(lambda conn: conn.execute('''
+            INSERT INTO force_subscribe_channels (channel_id, channel_username) VALUES (?, ?)
+            ON CONFLICT (channel_id) DO UPDATE SET channel_username = excluded.channel_username
+        ''', (channel_id, channel_username)))
+
+    async def remove_force_sub_channel(self, channel_id: int):
+        """Remove force subscribe channel"""
+        await self._call(lambda conn: conn.execute(
+            'DELETE FROM force_subscribe_channels WHERE channel_id = ?', (channel_id,)
+        ))
+
+    async def get_force_sub_channels(self) -> List[Dict]:
+        """Get all force subscribe channels"""
+        rows = await self._call(lambda conn: conn.execute('SELECT * FROM force_subscribe_channels').fetchall())
+        return [dict(row) for row in rows]
+
+    async def add_files(self, records: List[Dict]):
+        """Add or update catalog records"""
+        if not records:
+            return
+        rows = [
+            (r['channel'], r['message_id'], r['media_type'], r['file_id'], r['file_unique_id'],
+             r['file_name'], r['file_size'], r['mime_type'], r['caption'])
+            for r in records
+        ]
+        await self._call(lambda conn: conn.executemany('''
+            INSERT INTO files (channel, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel, message_id) DO UPDATE SET
+            media_type = excluded.media_type, file_id = excluded.file_id, file_unique_id = excluded.file_unique_id,
+            file_name = excluded.file_name, file_size = excluded.file_size, mime_type = excluded.mime_type,
+            caption = excluded.caption
+        ''', rows))
+
+    async def get_files_range(self, first_id: int, last_id: int, channel: int = 0) -> Dict[int, Dict]:
+        """Get one channel's catalog records between two message ids (inclusive), keyed by message id"""
+        rows = await self._call(lambda conn: conn.execute('''
+            SELECT channel, message_id, media_type, file_id, file_unique_id, file_name, file_size, mime_type, caption
+            FROM files WHERE channel = ? AND message_id BETWEEN ? AND ?
+        ''', (channel, min(first_id, last_id), max(first_id, last_id))).fetchall())
+        return {row['message_id']: dict(row) for row in rows}
+
+    async def find_files_by_unique_id(self, unique_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Earliest stored (channel, message_id) of each file_unique_id found in the catalog"""
+        if not unique_ids:
+            return {}
+        unique_ids = list(unique_ids)
+        placeholders = ', '.join('?' * len(unique_ids))
+        rows = await self._call(lambda conn: conn.execute(f'''
+            SELECT file_unique_id, channel, MIN(message_id) AS message_id FROM files
+            WHERE file_unique_id IN ({placeholders}) GROUP BY file_unique_id, channel
+        ''', unique_ids).fetchall())
+        found = {}
+        for row in rows:
+            stored = (row['channel'], row['message_id'])
+            found[row['file_unique_id']] = min(found.get(row['file_unique_id'], stored), stored)
+        return found
+
+    async def get_delivery_progress(self, user_id: int, batch_key: str) -> Optional[int]:
+        """Get the next offset to deliver for a user's batch link"""
+        row = await self._call(lambda conn: conn.execute(
+            'SELECT next_offset FROM delivery_progress WHERE user_id = ? AND batch_key = ?', (user_id, batch_key)
+        ).fetchone())
+        return row['next_offset'] if row else None
+
+    async def set_delivery_progress(self, user_id: int, batch_key: str, next_offset: int):
+        """Save the next offset to deliver for a user's batch link"""
+        await self._call(lambda conn: conn.execute('''
+            INSERT INTO delivery_progress (user_id, batch_key, next_offset) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, batch_key) DO UPDATE SET
+            next_offset = excluded.next_offset, updated_at = CURRENT_TIMESTAMP
+        ''', (user_id, batch_key, next_offset)))
+
+    async def clear_delivery_progress(self, user_id: int, batch_key: str):
+        """Forget a user's position in a fully delivered batch link"""
+        await self._call(lambda conn: conn.execute(
+            'DELETE FROM delivery_progress WHERE user_id = ? AND batch_key = ?', (user_id, batch_key)
+        ))
+
+    async def schedule_deletions(self, rows: List[Tuple[int, int, datetime]]):
+        """Queue (chat_id, message_id, due_at) messages for auto-delete"""
+        if not rows:
+            return
+        await self._call(lambda conn: conn.executemany('''
+            INSERT INTO scheduled_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?)
+            ON CONFLICT (chat_id, message_id) DO UPDATE SET due_at = excluded.due_at
+        ''', rows))
+
+    async def get_scheduled_deletions(self, due_before: datetime = None) -> List[Tuple[int, int, datetime]]:
+        """Queued deletions as (chat_id, message_id, due_at), soonest first; only those due by due_before if given"""
+        rows = await self._call(lambda conn: conn.execute(
+            'SELECT chat_id, message_id, due_at FROM scheduled_deletions WHERE ? IS NULL OR due_at <= ? ORDER BY due_at',
+            (due_before, due_before)
+        ).fetchall())
+        return [tuple(row) for row in rows]
+
+    async def remove_deletions(self, keys: List[Tuple[int, int]]):
+        """Drop (chat_id, message_id) entries from the deletion queue"""
+        if not keys:
+            return
+        await self._call(lambda conn: conn.executemany(
+            'DELETE FROM scheduled_deletions WHERE chat_id = ? AND message_id = ?', keys
+        ))
+
+    async def set_setting(self, key: str, value: str):
+        """Set bot setting"""
+        await self._call(lambda conn: conn.execute('''
+            INSERT INTO bot_settings (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        ''', (key, value)))
+
+    async def get_setting(self, key: str) -> Optional[str]:
+        """Get bot setting"""
+        row = await self._call(lambda conn: conn.execute(
+            'SELECT value FROM bot_settings WHERE key = ?', (key,)
+        ).fetchone())
+        return row['value'] if row else None
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserNotParticipant
+from database.database import db
+from cache import LRUCache, SingleFlight
+from config import LOGGER, OWNER_ID, FSUB_LINK_EXPIRY, FSUB_MEMBER_TTL, FSUB_NON_MEMBER_TTL, FSUB_CACHE_MAX_ENTRIES
+
+MEMBER_STATUSES = (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER)
+# Invite links are reused for this share of their lifetime, so a user never gets one about to expire
+LINK_REUSE_FRACTION = 0.5
+
+class ForceSubscribe:
+    """Gate on membership of the force subscribe channels.
+
+    The channel list is held in memory and reloaded when /addchnl or
+    /delchnl changes it. Memberships are cached per (user, channel):
+    members for FSUB_MEMBER_TTL, non-members only for FSUB_NON_MEMBER_TTL
+    so a user who just joined is let through on the next try. Channels
+    are checked concurrently, and a repeated check within the TTLs makes
+    no Telegram calls.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.channels = []
+        # Entries are bools, so the entry count is the binding limit
+        self.members = LRUCache(FSUB_CACHE_MAX_ENTRIES, FSUB_CACHE_MAX_ENTRIES * 256, FSUB_MEMBER_TTL)
+        self.flight = SingleFlight()
+        self.links = {}  # channel_id -> (expires_at, invite link)
+        self.logger = LOGGER(__name__)
+
+    async def load(self):
+        """Reload the channel list from the database"""
+        self.channels = await db.get_force_sub_channels()
+        known = {channel["channel_id"] for channel in self.channels}
+        for channel_id in list(self.links):
+            if channel_id not in known:
+                del self.links[channel_id]
+
+    async def is_member(self, user_id: int, channel_id: int) -> bool:
+        """Whether user_id may pass channel_id, from the cache when possible"""
+        member = self.members.get((user_id, channel_id))
+        if member is None:
+            member = await self.flight.do((user_id, channel_id), self._check, user_id, channel_id)
+        return member
+
+    async def _check(self, user_id: int, channel_id: int) -> bool:
+        try:
+            member = await self.bot.limiter.call(None, self.bot.get_chat_member, channel_id, user_id)
+            joined = member.status in MEMBER_STATUSES or (
+                member.status == ChatMemberStatus.RESTRICTED and member.is_member
+            )
+        except UserNotParticipant:
+            joined = False
+        except Exception as e:
+            # A misconfigured channel shouldn't lock every user out
+            self.logger.warning(f"Failed to check membership of {user_id} in {channel_id}: {e}")
+            self.members.set((user_id, channel_id), True, FSUB_NON_MEMBER_TTL)
+            return True
+        self.members.set((user_id, channel_id), joined, FSUB_MEMBER_TTL if joined else FSUB_NON_MEMBER_TTL)
+        return joined
+
+    async def missing_channels(self, user_id: int):
+        """Force subscribe channels user_id has not joined, in list order"""
+        if user_id == OWNER_ID or not self.channels:
+            return []
+        channels = list(self.channels)
+        joined = await asyncio.gather(*(self.is_member(user_id, channel["channel_id"]) for channel in channels))
+        return [channel for channel, ok in zip(channels, joined) if not ok]
+
+    async def invite_link(self, channel) -> str:
+        """Join link of a channel: its public link, or a reused invite link"""
+        if channel.get("channel_username"):
+            return f"https://t.me/{channel['channel_username']}"
+        channel_id = channel["channel_id"]
+        cached = self.links.get(channel_id)
+        now = datetime.now()
+        if cached and (cached[0] is None or cached[0] > now):
+            return cached[1]
+        expire_date = now + timedelta(seconds=FSUB_LINK_EXPIRY) if FSUB_LINK_EXPIRY else None
+        invite = await self.bot.limiter.call(
+            None, self.bot.create_chat_invite_link, channel_id, expire_date=expire_date
+        )
+        reuse_until = now + timedelta(seconds=FSUB_LINK_EXPIRY * LINK_REUSE_FRACTION) if FSUB_LINK_EXPIRY else None
+        self.links[channel_id] = (reuse_until, invite.invite_link)
+        return invite.invite_link
+
+    def stats(self) -> dict:
+        return {"channels": len(self.channels), **self.members.stats()}
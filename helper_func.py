@@ -1,25 +1,20 @@
-import base64
 import re
-import asyncio
 import aiofiles
-from pyrogram.errors import FloodWait
-from config import CHANNEL_ID
-
-async def encode(string):
-    string_bytes = string.encode("ascii")
-    base64_bytes = base64.urlsafe_b64encode(string_bytes)
-    base64_string = base64_bytes.decode("ascii").strip("=")
-    return base64_string
-
-async def decode(base64_string):
-    try:
-        base64_string += "=" * (-len(base64_string) % 4)
-        base64_bytes = base64_string.encode("ascii")
-        string_bytes = base64.urlsafe_b64decode(base64_bytes)
-        string = string_bytes.decode("ascii")
-        return string
-    except Exception:
-        return None
+from config import LOGGER, FILE_CACHE_MAX_ENTRIES, FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL
+from database.database import db
+from cache import LRUCache, SingleFlight
+from links import encode_link, decode_link, FILE, BATCH, PAGE
+
+MEDIA_TYPES = ("photo", "video", "document", "audio", "voice", "video_note", "sticker", "animation")
+
+# Hot catalog records keyed by (storage channel index, message id)
+file_cache = LRUCache(FILE_CACHE_MAX_ENTRIES, FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL)
+# Shares one catalog/channel resolution among concurrent opens of the same link
+file_flight = SingleFlight()
+
+def share_link(bot, first_id: int, last_id: int = None, channel: int = 0) -> str:
+    """Deep link opening one stored message, or every message from first_id to last_id, of a storage channel"""
+    return f"https://t.me/{bot.username}?start={encode_link(first_id, last_id, channel=channel)}"
 
 def get_name(media):
     if media.photo:
@@ -40,24 +35,167 @@ def get_name(media):
         return media.animation.file_name or "animation"
     return "unknown"
 
-async def get_message_from_id(bot, ids):
-    messages = []
-    total_messages = 0
-    while total_messages != len(ids):
-        temp_ids = ids[total_messages:total_messages+200]
-        try:
-            msgs = await bot.get_messages(chat_id=CHANNEL_ID, message_ids=temp_ids)
-        except FloodWait as e:
-            await asyncio.sleep(e.x)
-            msgs = await bot.get_messages(chat_id=CHANNEL_ID, message_ids=temp_ids)
-        except:
-            msgs = []
-        total_messages += len(temp_ids)
+def get_media_type(msg):
+    for media_type in MEDIA_TYPES:
+        if getattr(msg, media_type, None):
+            return media_type
+    if msg.text:
+        return "text"
+    return "unknown"
+
+def to_file_record(msg, channel=0):
+    """Slim catalog record holding only what link delivery needs"""
+    media_type = get_media_type(msg)
+    media = getattr(msg, media_type, None) if media_type in MEDIA_TYPES else None
+    if media_type == "text":
+        caption = msg.text.html
+    else:
+        caption = msg.caption.html if msg.caption else ""
+    return {
+        "channel": channel,
+        "message_id": msg.id,
+        "media_type": media_type,
+        "file_id": getattr(media, "file_id", None),
+        "file_unique_id": getattr(media, "file_unique_id", None),
+        "file_name": get_name(msg) if media else None,
+        "file_size": getattr(media, "file_size", None),
+        "mime_type": getattr(media, "mime_type", None),
+        "caption": caption,
+    }
+
+def get_file_unique_id(msg):
+    """Telegram's stable id of the file in msg, the same across re-uploads; None without a file"""
+    media_type = get_media_type(msg)
+    if media_type not in MEDIA_TYPES:
+        return None
+    return getattr(getattr(msg, media_type), "file_unique_id", None)
+
+def empty_record(msg_id, channel=0):
+    """Catalog tombstone for a deleted channel message, so it isn't re-fetched"""
+    return {
+        "channel": channel,
+        "message_id": msg_id,
+        "media_type": "empty",
+        "file_id": None,
+        "file_unique_id": None,
+        "file_name": None,
+        "file_size": None,
+        "mime_type": None,
+        "caption": None,
+    }
+
+async def fetch_file_records(bot, ids, channel=0):
+    """Fetch ids from a storage channel in 200-message chunks as catalog records"""
+    records = {}
+    chat_id = bot.storage.chat_id(channel)
+    for i in range(0, len(ids), 200):
+        temp_ids = ids[i:i+200]
+        msgs = await bot.limiter.call(None, bot.get_messages, chat_id=chat_id, message_ids=temp_ids)
         for msg in msgs:
-            if not msg or msg.empty:
+            if not msg:
                 continue
-            messages.append(msg)
-    return messages
+            records[msg.id] = empty_record(msg.id, channel) if msg.empty else to_file_record(msg, channel)
+    return records
+
+async def load_file_records(bot, ids, channel=0):
+    """Load ids from the catalog, backfilling misses from their storage channel"""
+    found = await db.get_files_range(min(ids), max(ids), channel)
+    missing = [i for i in ids if i not in found]
+    if missing:
+        fetched = await fetch_file_records(bot, missing, channel)
+        try:
+            await db.add_files(list(fetched.values()))
+        except Exception as e:
+            LOGGER(__name__).warning(f"Failed to backfill file catalog: {e}")
+        found.update(fetched)
+    return found
+
+async def resolve_file_records(bot, ids, channel=0):
+    """Load ids from the catalog or storage channel and cache the result"""
+    found = await load_file_records(bot, ids, channel)
+    for i in ids:
+        if i in found:
+            file_cache.set((channel, i), found[i])
+    return found
+
+async def get_file_records(bot, ids, channel=0):
+    """Resolve ids via the cache, then the catalog, backfilling misses from their storage channel"""
+    records = {}
+    uncached = []
+    for i in ids:
+        record = file_cache.get((channel, i))
+        if record is None:
+            uncached.append(i)
+        else:
+            records[i] = record
+    if uncached:
+        found = await file_flight.do((channel, tuple(uncached)), resolve_file_records, bot, uncached, channel)
+        for i in uncached:
+            if i in found:
+                records[i] = found[i]
+    return [records[i] for i in ids if i in records and records[i]["media_type"] != "empty"]
+
+async def iter_file_record_chunks(bot, first_id, last_id, channel=0, chunk_size=200):
+    """Yield the live records of first_id..last_id one chunk at a time, bypassing the delivery cache"""
+    for start in range(first_id, last_id + 1, chunk_size):
+        ids = range(start, min(start + chunk_size, last_id + 1))
+        found = await load_file_records(bot, ids, channel)
+        yield [found[i] for i in ids if i in found and found[i]["media_type"] != "empty"]
+
+async def backfill_catalog(bot, first_id=1, last_id=None, channel=0, chunk_size=200, on_progress=None):
+    """Catalog uncatalogued history of a storage channel chunk by chunk, seeding the dedup index.
+
+    Without last_id the scan stops at the first chunk holding no message.
+    Tombstones after the last message seen are never written, since those
+    ids may simply not be used yet.
+    """
+    scanned = cataloged = 0
+    pending = []
+    start = first_id
+    while last_id is None or start <= last_id:
+        end = start + chunk_size - 1 if last_id is None else min(start + chunk_size - 1, last_id)
+        ids = range(start, end + 1)
+        found = await db.get_files_range(start, end, channel)
+        missing = [i for i in ids if i not in found]
+        fetched = await fetch_file_records(bot, missing, channel) if missing else {}
+        if last_id is None and all(
+            record["media_type"] == "empty" for record in (*found.values(), *fetched.values())
+        ):
+            break
+        records = []
+        for i in ids:
+            record = fetched.get(i) or found.get(i)
+            if record is None:
+                continue
+            if record["media_type"] == "empty":
+                if i in fetched:
+                    pending.append(record)
+                continue
+            # A later message proves the pending gaps were deleted messages
+            records.extend(pending)
+            pending = []
+            if i in fetched:
+                records.append(record)
+                cataloged += 1
+        await db.add_files(records)
+        scanned += len(ids)
+        if on_progress:
+            await on_progress(scanned, cataloged, end)
+        start = end + 1
+    return {"scanned": scanned, "cataloged": cataloged, "last_id": start - 1}
+
+LINK_EXPORT_FIELDS = ("message_id", "media_type", "file_name", "file_size", "size", "link")
+
+def link_row(bot, record):
+    """Export row for one catalog record, with its share link"""
+    return {
+        "message_id": record["message_id"],
+        "media_type": record["media_type"],
+        "file_name": record["file_name"] or "",
+        "file_size": record["file_size"] or 0,
+        "size": get_size(record["file_size"]) if record["file_size"] else "",
+        "link": share_link(bot, record["message_id"], channel=record["channel"]),
+    }
 
 def get_size(size):
     units = ["Bytes", "KB", "MB", "GB", "TB", "PB", "EB"]
@@ -68,6 +206,17 @@ def get_size(size):
         size /= 1024.0
     return "%.2f %s" % (size, units[i])
 
+def get_readable_time(seconds):
+    """Duration like '1h 5m' or '30s'"""
+    parts = []
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            parts.append(f"{seconds // length}{unit}")
+            seconds %= length
+    if seconds or not parts:
+        parts.append(f"{seconds}s")
+    return " ".join(parts)
+
 def get_file_id(msg):
     if msg.photo:
         return msg.photo.file_id
@@ -0,0 +1,70 @@
+import asyncio
+from database.database import db
+from config import LOGGER
+
+# Seconds start() waits to learn whether this process leads
+ELECTION_TIMEOUT = 10
+
+class Leadership:
+    """Runs the singleton duties in exactly one of the processes sharing the database.
+
+    Leadership comes from the backend (a Postgres advisory lock, or always
+    for the single-process backends). The leader runs broadcast jobs, the
+    auto-delete scheduler and the stats counts; when it dies or loses its
+    database connection, another process is elected and takes them over.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.is_leader = False
+        self.elections = 0
+        self._decided = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.logger = LOGGER(__name__)
+
+    async def start(self) -> bool:
+        """Start competing for leadership; returns whether this process leads right away"""
+        self._task = asyncio.create_task(db.hold_leadership(self._on_change))
+        try:
+            await asyncio.wait_for(asyncio.shield(self._decided.wait()), ELECTION_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.warning("Leader election undecided, starting as a follower")
+        return self.is_leader
+
+    async def stop(self):
+        """Stop competing, handing the duties over if this process leads"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._on_change(False)
+
+    async def _on_change(self, leader: bool):
+        async with self._lock:
+            self._decided.set()
+            db.stats_leader = leader
+            if leader == self.is_leader:
+                return
+            self.is_leader = leader
+            if leader:
+                self.elections += 1
+                self.logger.info(f"Worker {self.bot.worker_id} is now the leader")
+                await self._lead()
+            else:
+                self.logger.info(f"Worker {self.bot.worker_id} stepped down as leader")
+                await self._follow()
+
+    async def _lead(self):
+        try:
+            await self.bot.auto_delete.start()
+        except Exception as e:
+            self.logger.warning(f"Failed to start auto-delete: {e}")
+        self.bot.broadcasts.watch()
+
+    async def _follow(self):
+        await self.bot.broadcasts.stop_all()
+        await self.bot.auto_delete.stop()
@@ -0,0 +1,178 @@
+import hmac
+import base64
+import hashlib
+import binascii
+from typing import NamedTuple, Optional
+from config import CHANNEL_ID, LINK_SECRET, ALLOW_LEGACY_LINKS
+
+# Payload layout (before base64url, padding stripped):
+#   header  1 byte   high nibble LINK_VERSION, bit 0 set when a tag follows
+#   kind    varint   FILE, BATCH or PAGE
+#   channel varint   index of the storage channel
+#   first   varint   first message id
+#   delta   varint   zigzag(last - first), BATCH and PAGE only
+#   offset  varint   next offset into the range, PAGE only
+#   tag     4 bytes  truncated HMAC-SHA256 of everything before it, when LINK_SECRET is set
+LINK_VERSION = 1
+TAGGED = 0x01
+TAG_SIZE = 4
+
+FILE = 0
+BATCH = 1
+PAGE = 2
+
+# Telegram rejects deep-link start parameters longer than this
+MAX_PAYLOAD = 64
+
+_SECRET = LINK_SECRET.encode() if LINK_SECRET else b""
+_TO_URLSAFE = bytes.maketrans(b"+/", b"-_")
+_FROM_URLSAFE = bytes.maketrans(b"-_", b"+/")
+
+class Link(NamedTuple):
+    kind: int
+    channel: int
+    first: int
+    last: int
+    offset: int = 0
+
+def _read_varints(data, pos: int, end: int) -> list:
+    """Every varint in data[pos:end]"""
+    values = []
+    value = shift = 0
+    while pos < end:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            values.append(value)
+            value = shift = 0
+        else:
+            shift += 7
+            if shift > 63:
+                raise ValueError("varint too long")
+    if shift:
+        raise ValueError("truncated varint")
+    return values
+
+def _tag(body) -> bytes:
+    return hmac.new(_SECRET, body, hashlib.sha256).digest()[:TAG_SIZE]
+
+def encode_link(first: int, last: int = None, channel: int = 0, offset: int = None) -> str:
+    """Start payload for one message, a range of messages, or a page cursor into a range"""
+    if offset is not None:
+        kind = PAGE
+    elif last is None or last == first:
+        kind = FILE
+    else:
+        kind = BATCH
+    fields = [kind, channel, first]
+    if kind != FILE:
+        delta = (last if last is not None else first) - first
+        fields.append(delta << 1 if delta >= 0 else (-delta << 1) - 1)
+    if kind == PAGE:
+        fields.append(offset)
+    buf = bytearray((LINK_VERSION << 4 | (TAGGED if _SECRET else 0),))
+    for value in fields:
+        # Negative values fail in append with ValueError
+        while value > 0x7F:
+            buf.append(value & 0x7F | 0x80)
+            value >>= 7
+        buf.append(value)
+    if _SECRET:
+        buf += _tag(buf)
+    return binascii.b2a_base64(buf, newline=False).translate(_TO_URLSAFE).rstrip(b"=").decode("ascii")
+
+def _decode_binary(data: bytes) -> Optional[Link]:
+    end = len(data)
+    if data[0] & TAGGED:
+        end -= TAG_SIZE
+        if not _SECRET or end <= 1:
+            return None
+        if not hmac.compare_digest(_tag(data[:end]), data[end:]):
+            return None
+    elif _SECRET:
+        # Untagged links are forgeable, refuse them once links are signed
+        return None
+    fields = _read_varints(data, 1, end)
+    kind = fields[0]
+    if kind == FILE and len(fields) == 3:
+        return Link(FILE, fields[1], fields[2], fields[2])
+    if kind in (BATCH, PAGE) and len(fields) == (4 if kind == BATCH else 5):
+        delta = fields[3]
+        last = fields[2] + (delta >> 1 if not delta & 1 else -((delta + 1) >> 1))
+        return Link(kind, fields[1], fields[2], last, fields[4] if kind == PAGE else 0)
+    return None
+
+def _decode_legacy(text: str) -> Optional[Link]:
+    """Links from before the binary codec: "get-<id*|channel|>[-<id*|channel|>]"
+    and page cursors "<start>-<end>-<offset>"
+
+    Neither is signed. Once LINK_SECRET is set, page cursors are refused
+    (they were never shared, so no valid one is lost), and get- links only
+    pass with ALLOW_LEGACY_LINKS.
+    """
+    parts = text.split("-")
+    if parts[0] == "get":
+        if _SECRET and not ALLOW_LEGACY_LINKS:
+            return None
+        multiplier = abs(CHANNEL_ID)
+        ids = []
+        for part in parts[1:]:
+            # Exact integer division; the old float division lost precision on large ids
+            message_id, remainder = divmod(int(part), multiplier)
+            if remainder:
+                return None
+            ids.append(message_id)
+        if len(ids) == 1:
+            return Link(FILE, 0, ids[0], ids[0])
+        if len(ids) == 2:
+            return Link(BATCH, 0, ids[0], ids[1])
+        return None
+    if len(parts) == 3 and not _SECRET:
+        start, end, offset = map(int, parts)
+        return Link(PAGE, 0, start, end, offset)
+    return None
+
+def decode_link(payload: str) -> Optional[Link]:
+    """Parse a start payload or page cursor, binary or legacy; None when invalid or forged"""
+    if not payload or len(payload) > MAX_PAYLOAD:
+        return None
+    try:
+        data = binascii.a2b_base64((payload + "=" * (-len(payload) % 4)).encode("ascii").translate(_FROM_URLSAFE))
+        if not data:
+            return None
+        if data[0] >> 4 == LINK_VERSION:
+            return _decode_binary(data)
+        return _decode_legacy(data.decode("ascii"))
+    except (binascii.Error, UnicodeError, ValueError, IndexError):
+        return None
+
+if __name__ == "__main__":
+    # Microbenchmark: python links.py
+    import timeit
+
+    multiplier = abs(CHANNEL_ID)
+
+    def legacy_encode(first, last):
+        text = f"get-{first * multiplier}-{last * multiplier}"
+        return base64.urlsafe_b64encode(text.encode("ascii")).decode("ascii").strip("=")
+
+    def legacy_decode(payload):
+        text = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode("ascii")
+        argument = text.split("-")
+        return int(int(argument[1]) / multiplier), int(int(argument[2]) / multiplier)
+
+    first, last = 123456, 123556
+    old, new = legacy_encode(first, last), encode_link(first, last)
+    runs = 200000
+    rows = [
+        ("legacy encode", lambda: legacy_encode(first, last)),
+        ("binary encode", lambda: encode_link(first, last)),
+        ("legacy decode", lambda: legacy_decode(old)),
+        ("binary decode", lambda: decode_link(new)),
+        ("compat decode", lambda: decode_link(old)),
+    ]
+    print(f"payload length: legacy {len(old)} chars, binary {len(new)} chars")
+    for name, func in rows:
+        seconds = timeit.timeit(func, number=runs)
+        print(f"{name}: {seconds / runs * 1e6:.2f} us/op")
@@ -1,7 +1,12 @@
 from bot import Bot
 import pyrogram.utils
+from config import WORKER_PROCESSES
 
 pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
 
 if __name__ == "__main__":
-    Bot().run()
\ No newline at end of file
+    if WORKER_PROCESSES > 1:
+        from workers import supervise
+        supervise(WORKER_PROCESSES)
+    else:
+        Bot().run()
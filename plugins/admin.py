@@ -1,10 +1,19 @@
+import io
+import time
+import os
+import csv
+import json
 import asyncio
+import tempfile
+import aiofiles
 from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import Message
+from pyrogram.enums import ChatMemberStatus
 from database.database import db
-from config import OWNER_ID, CHANNEL_ID
+from config import OWNER_ID
 from helper_func import *
+from broadcast import progress_text, RUNNING
 
 def is_admin_filter(_, __, message):
     """Filter for admin users"""
@@ -19,10 +28,10 @@ async def link_generator(bot: Client, message: Message):
     if not replied:
         return await message.reply_text("Reply to a message to generate link.")
     
-    msg_id = replied.message_id
+    msg_id = replied.id
     await message.reply_text(
         f"**Your Link Generated!**\n\n"
-        f"https://t.me/{bot.username}?start={await encode(f'get-{msg_id * abs(bot.db_channel.id)}')}\n\n"
+        f"{share_link(bot, msg_id)}\n\n"
         f"**Message ID:** {msg_id}"
     )
 
@@ -30,37 +39,154 @@ async def link_generator(bot: Client, message: Message):
 async def batch_link_generator(bot: Client, message: Message):
     """Generate batch links"""
     if len(message.command) < 3:
-        return await message.reply_text("Usage: `/batch <first_message_id> <last_message_id>`")
+        return await message.reply_text("Usage: `/batch <first_message_id> <last_message_id> [channel]`")
     
     try:
         first_msg_id = int(message.command[1])
         last_msg_id = int(message.command[2])
+        channel = int(message.command[3]) if len(message.command) > 3 else 0
     except:
         return await message.reply_text("Message IDs should be integers.")
+    if not bot.storage.valid(channel):
+        return await message.reply_text(f"Channel should be a storage channel index from 0 to {len(bot.storage) - 1}.")
     
     if first_msg_id > last_msg_id:
         first_msg_id, last_msg_id = last_msg_id, first_msg_id
     
-    batch_link = f"https://t.me/{bot.username}?start={await encode(f'get-{first_msg_id * abs(bot.db_channel.id)}-{last_msg_id * abs(bot.db_channel.id)}')}"
+    batch_link = share_link(bot, first_msg_id, last_msg_id, channel)
     
     await message.reply_text(
         f"**Batch Link Generated!**\n\n"
         f"{batch_link}\n\n"
         f"**From:** {first_msg_id}\n"
-        f"**To:** {last_msg_id}"
+        f"**To:** {last_msg_id}\n"
+        f"**Channel:** {bot.storage.chat_id(channel)}"
     )
 
+@Client.on_message(filters.command("genlinks") & admin_filter)
+async def bulk_link_generator(bot: Client, message: Message):
+    """Export a link for every message in a range as a CSV or JSON document"""
+    if len(message.command) < 3:
+        return await message.reply_text("Usage: `/genlinks <first_message_id> <last_message_id> [csv|json] [channel]`")
+    
+    try:
+        first_msg_id = int(message.command[1])
+        last_msg_id = int(message.command[2])
+        channel = int(message.command[4]) if len(message.command) > 4 else 0
+    except ValueError:
+        return await message.reply_text("Message IDs should be integers.")
+    if not bot.storage.valid(channel):
+        return await message.reply_text(f"Channel should be a storage channel index from 0 to {len(bot.storage) - 1}.")
+    
+    export_format = message.command[3].lower() if len(message.command) > 3 else "csv"
+    if export_format not in ("csv", "json"):
+        return await message.reply_text("Format should be `csv` or `json`.")
+    
+    if first_msg_id > last_msg_id:
+        first_msg_id, last_msg_id = last_msg_id, first_msg_id
+    
+    status = await message.reply_text(f"⏳ Generating links for messages {first_msg_id}–{last_msg_id}...")
+    path = os.path.join(tempfile.gettempdir(), f"links_{channel}_{first_msg_id}_{last_msg_id}_{message.id}.{export_format}")
+    count = 0
+    try:
+        # Written chunk by chunk, so only one chunk of records is held at a time
+        async with aiofiles.open(path, "w", encoding="utf-8", newline="") as f:
+            if export_format == "csv":
+                await f.write(",".join(LINK_EXPORT_FIELDS) + "\r\n")
+            else:
+                await f.write("[")
+            async for records in iter_file_record_chunks(bot, first_msg_id, last_msg_id, channel):
+                rows = [link_row(bot, record) for record in records]
+                if export_format == "csv":
+                    buffer = io.StringIO()
+                    csv.DictWriter(buffer, LINK_EXPORT_FIELDS).writerows(rows)
+                    await f.write(buffer.getvalue())
+                else:
+                    await f.write("".join(
+                        ("," if count + i else "") + "\n  " + json.dumps(row, ensure_ascii=False)
+                        for i, row in enumerate(rows)
+                    ))
+                count += len(rows)
+            if export_format == "json":
+                await f.write("\n]\n")
+        
+        await message.reply_document(
+            path,
+            caption=f"🔗 **{count} links** for messages {first_msg_id}–{last_msg_id}"
+        )
+        await status.delete()
+    except Exception as e:
+        await status.edit_text(f"❌ Failed to generate links: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+# Seconds between backfill progress edits
+BACKFILL_PROGRESS_INTERVAL = 5
+# The running /backfill scan, only one at a time
+backfill_task = None
+
+async def run_backfill(bot: Client, status: Message, first_msg_id: int, last_msg_id: int = None, channel: int = 0):
+    """Catalog a storage channel's history and report progress on status"""
+    last_edit = 0
+
+    async def on_progress(scanned, cataloged, end):
+        nonlocal last_edit
+        if time.monotonic() - last_edit < BACKFILL_PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(
+                f"🗂 **Backfilling Catalog...**\n\n"
+                f"🔎 Scanned: {scanned} (up to message {end})\n"
+                f"➕ Cataloged: {cataloged}"
+            )
+        except Exception:
+            pass
+
+    try:
+        result = await backfill_catalog(bot, first_msg_id, last_msg_id, channel, on_progress=on_progress)
+        await status.edit_text(
+            f"✅ **Backfill Completed**\n\n"
+            f"🔎 Scanned: {result['scanned']} (messages {first_msg_id}–{result['last_id']})\n"
+            f"➕ Cataloged: {result['cataloged']}"
+        )
+    except Exception as e:
+        await status.edit_text(f"❌ Backfill failed: {e}")
+
+@Client.on_message(filters.command("backfill") & admin_filter)
+async def backfill_command(bot: Client, message: Message):
+    """Scan a storage channel's history into the file catalog, seeding upload deduplication"""
+    global backfill_task
+    if backfill_task and not backfill_task.done():
+        return await message.reply_text("A backfill is already running.")
+
+    try:
+        first_msg_id = int(message.command[1]) if len(message.command) > 1 else 1
+        last_msg_id = int(message.command[2]) if len(message.command) > 2 and message.command[2] != "-" else None
+        channel = int(message.command[3]) if len(message.command) > 3 else 0
+    except ValueError:
+        return await message.reply_text("Usage: `/backfill [first_message_id] [last_message_id|-] [channel]`")
+    if not bot.storage.valid(channel):
+        return await message.reply_text(f"Channel should be a storage channel index from 0 to {len(bot.storage) - 1}.")
+
+    if last_msg_id is not None and first_msg_id > last_msg_id:
+        first_msg_id, last_msg_id = last_msg_id, first_msg_id
+
+    status = await message.reply_text("🗂 Starting catalog backfill...")
+    backfill_task = asyncio.create_task(run_backfill(bot, status, first_msg_id, last_msg_id, channel))
+
 @Client.on_message(filters.command("users") & admin_filter)
 async def users_command(bot: Client, message: Message):
     """Get users statistics"""
-    users_count = await db.get_users_count()
-    banned_count = len(await db.get_banned_users())
+    stats = await db.get_stats()
     
     await message.reply_text(
         f"📊 **Bot Statistics**\n\n"
-        f"👥 Total Users: {users_count}\n"
-        f"🚫 Banned Users: {banned_count}\n"
-        f"✅ Active Users: {users_count - banned_count}"
+        f"👥 Total Users: {stats['total_users']}\n"
+        f"🚫 Banned Users: {stats['banned_users']}\n"
+        f"✅ Active Users ({stats['active_days']}d): {stats['active_users']}\n"
+        f"🆕 New Today: {stats['signups_today']} ({stats['signup_days']}d: {stats['signups_recent']})"
     )
 
 @Client.on_message(filters.command("broadcast") & admin_filter)
@@ -69,26 +195,70 @@ async def broadcast_handler(bot: Client, message: Message):
     if not message.reply_to_message:
         return await message.reply_text("Reply to a message to broadcast.")
     
-    users = await db.get_all_users()
     broadcast_msg = message.reply_to_message
-    
     temp_msg = await message.reply_text("Broadcasting...")
-    success = 0
-    failed = 0
-    
-    for user in users:
+    broadcast_id = await bot.broadcasts.start(
+        broadcast_msg.chat.id, broadcast_msg.id, temp_msg.chat.id, temp_msg.id
+    )
+    await temp_msg.edit_text(
+        f"📣 **Broadcast Started**\n\n"
+        f"🆔 Job: `{broadcast_id}`\n"
+        f"Use `/broadcast_status {broadcast_id}` or `/broadcast_cancel {broadcast_id}`."
+    )
+
+@Client.on_message(filters.command("broadcast_status") & admin_filter)
+async def broadcast_status(bot: Client, message: Message):
+    """Show a broadcast job, or every running one"""
+    if len(message.command) > 1:
         try:
-            await broadcast_msg.copy(user['user_id'])
-            success += 1
-        except Exception:
-            failed += 1
+            job = await db.get_broadcast(int(message.command[1]))
+        except ValueError:
+            return await message.reply_text("Broadcast ID should be an integer.")
+        if not job:
+            return await message.reply_text("Broadcast not found.")
+        return await message.reply_text(progress_text(job))
     
-    await temp_msg.edit_text(
-        f"✅ **Broadcast Completed**\n\n"
-        f"📤 Successfully sent: {success}\n"
-        f"❌ Failed to send: {failed}"
+    jobs = await db.get_broadcasts(RUNNING)
+    if not jobs:
+        return await message.reply_text("No broadcasts running.")
+    await message.reply_text("\n\n".join(progress_text(job) for job in jobs))
+
+@Client.on_message(filters.command("broadcast_cancel") & admin_filter)
+async def broadcast_cancel(bot: Client, message: Message):
+    """Cancel a running broadcast job"""
+    if len(message.command) < 2:
+        return await message.reply_text("Usage: `/broadcast_cancel <broadcast_id>`")
+    
+    try:
+        broadcast_id = int(message.command[1])
+    except ValueError:
+        return await message.reply_text("Broadcast ID should be an integer.")
+    
+    if await bot.broadcasts.cancel(broadcast_id):
+        await message.reply_text(f"🛑 Broadcast {broadcast_id} is being cancelled.")
+    else:
+        await message.reply_text(f"Broadcast {broadcast_id} is not running.")
+
+@Client.on_message(filters.command("deadusers") & admin_filter)
+async def dead_users_command(bot: Client, message: Message):
+    """Report users by last failed delivery outcome"""
+    counts = await db.get_delivery_status_counts()
+    await message.reply_text(
+        f"💀 **Unreachable Users**\n\n"
+        f"🚫 Blocked the bot: {counts.get('blocked', 0)}\n"
+        f"👻 Deleted account: {counts.get('deactivated', 0)}\n"
+        f"⏳ Last failed on flood: {counts.get('flood', 0)}\n"
+        f"❓ Other errors: {counts.get('other', 0)}\n\n"
+        f"Use /purgedead to delete blocked and deleted users."
     )
 
+@Client.on_message(filters.command("purgedead") & admin_filter)
+async def purge_dead_command(bot: Client, message: Message):
+    """Delete users who blocked the bot or deleted their account"""
+    await db.flush_delivery_outcomes()
+    purged = await db.purge_dead_users()
+    await message.reply_text(f"✅ Purged {purged} unreachable users.")
+
 @Client.on_message(filters.command("ban") & admin_filter)
 async def ban_user(bot: Client, message: Message):
     """Ban a user"""
@@ -120,21 +290,76 @@ async def unban_user(bot: Client, message: Message):
 @Client.on_message(filters.command("banlist") & admin_filter)
 async def banned_users_list(bot: Client, message: Message):
     """Get list of banned users"""
-    banned_users = await db.get_banned_users()
+    # The in-process banned set is exact and needs no query
+    banned_count = len(db.banned_ids)
     
-    if not banned_users:
+    if not banned_count:
         return await message.reply_text("No banned users found.")
     
     text = "🚫 **Banned Users:**\n\n"
-    for user in banned_users[:20]:  # Limit to 20 users
-        name = user.get('first_name', 'Unknown')
-        text += f"• {name} (`{user['user_id']}`)\n"
+    # Only the first page is needed, limit to 20 users
+    async for page in db.iter_user_pages(('user_id', 'first_name'), batch_size=20, banned=True):
+        for user in page:
+            name = user['first_name'] or 'Unknown'
+            text += f"• {name} (`{user['user_id']}`)\n"
+        break
     
-    if len(banned_users) > 20:
-        text += f"\n... and {len(banned_users) - 20} more users"
+    if banned_count > 20:
+        text += f"\n... and {banned_count - 20} more users"
     
     await message.reply_text(text)
 
+@Client.on_message(filters.command("addchnl") & admin_filter)
+async def add_force_sub_channel(bot: Client, message: Message):
+    """Add a force subscribe channel"""
+    if len(message.command) < 2:
+        return await message.reply_text("Usage: `/addchnl <channel_id>`")
+
+    try:
+        channel_id = int(message.command[1])
+    except ValueError:
+        return await message.reply_text("Channel ID should be an integer.")
+
+    try:
+        chat = await bot.get_chat(channel_id)
+        # Membership checks and invite links both need the bot to be an admin
+        member = await bot.get_chat_member(channel_id, "me")
+    except Exception as e:
+        return await message.reply_text(f"❌ Can't access channel `{channel_id}`: {e}")
+    if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+        return await message.reply_text(f"❌ Make me an admin in {chat.title} first.")
+
+    await db.add_force_sub_channel(channel_id, chat.username)
+    await bot.fsub.load()
+    await message.reply_text(f"✅ Added {chat.title} (`{channel_id}`) as a force subscribe channel.")
+
+@Client.on_message(filters.command("delchnl") & admin_filter)
+async def del_force_sub_channel(bot: Client, message: Message):
+    """Remove a force subscribe channel"""
+    if len(message.command) < 2:
+        return await message.reply_text("Usage: `/delchnl <channel_id>`")
+
+    try:
+        channel_id = int(message.command[1])
+    except ValueError:
+        return await message.reply_text("Channel ID should be an integer.")
+
+    await db.remove_force_sub_channel(channel_id)
+    await bot.fsub.load()
+    await message.reply_text(f"✅ Removed `{channel_id}` from the force subscribe channels.")
+
+@Client.on_message(filters.command("listchnl") & admin_filter)
+async def list_force_sub_channels(bot: Client, message: Message):
+    """List the force subscribe channels"""
+    if not bot.fsub.channels:
+        return await message.reply_text("No force subscribe channels.")
+
+    text = "📢 **Force Subscribe Channels:**\n\n"
+    for channel in bot.fsub.channels:
+        name = f"@{channel['channel_username']}" if channel["channel_username"] else "private"
+        text += f"• {name} (`{channel['channel_id']}`)\n"
+    await message.reply_text(text)
+
 @Client.on_message(filters.command("stats") & admin_filter)
 async def stats_command(bot: Client, message: Message):
     """Bot uptime and stats"""
@@ -144,11 +369,111 @@ async def stats_command(bot: Client, message: Message):
     seconds = int(uptime % 60)
     
     uptime_str = f"{hours}h {minutes}m {seconds}s"
-    users_count = await db.get_users_count()
+    users_count = (await db.get_stats())['total_users']
+    flush_stats = db.user_flush_stats
+    startup = bot.startup.snapshot()
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup['phases'].items())
     
     await message.reply_text(
         f"📊 **Bot Statistics**\n\n"
         f"⏰ Uptime: {uptime_str}\n"
         f"👥 Total Users: {users_count}\n"
+        f"📥 User Queue: {db.user_queue_depth} pending\n"
+        f"🚦 FloodWaits: {bot.limiter.flood_waits} ({bot.limiter.flood_seconds:.0f}s total)\n"
+        f"💾 Last Flush: {flush_stats['last_flush_size']} users in {flush_stats['last_flush_latency'] * 1000:.1f} ms "
+        f"(max {flush_stats['max_flush_latency'] * 1000:.1f} ms)\n"
+        f"🏷 Worker: {bot.worker_id}{' (leader)' if bot.leadership.is_leader else ''}\n"
+        f"🚀 Startup: {startup['elapsed']:.2f}s {startup['state']} ({phases})\n"
         f"🤖 Bot: @{bot.username}"
-    )
\ No newline at end of file
+    )
+
+@Client.on_message(filters.command("cachestats") & admin_filter)
+async def cache_stats_command(bot: Client, message: Message):
+    """File and membership cache statistics"""
+    stats = file_cache.stats()
+    flight = file_flight.stats()
+    fsub = bot.fsub.stats()
+    await message.reply_text(
+        f"🗄 **File Cache**\n\n"
+        f"📦 Entries: {stats['entries']} ({get_size(stats['bytes'])})\n"
+        f"🎯 Hit Ratio: {stats['hit_ratio'] * 100:.1f}% ({stats['hits']} hits / {stats['misses']} misses)\n"
+        f"♻️ Evictions: {stats['evictions']}\n"
+        f"⌛ Expired: {stats['expirations']}\n\n"
+        f"🔀 **Coalesced Fetches**\n"
+        f"📡 Upstream Calls: {flight['calls']} ({flight['in_flight']} in flight)\n"
+        f"🤝 Shared Results: {flight['shared']} ({flight['dedup_ratio'] * 100:.1f}% saved)\n"
+        f"👥 Max Waiters: {flight['max_waiters']}\n\n"
+        f"📢 **Force Subscribe Memberships** ({fsub['channels']} channels)\n"
+        f"📦 Entries: {fsub['entries']}\n"
+        f"🎯 Hit Ratio: {fsub['hit_ratio'] * 100:.1f}% ({fsub['hits']} hits / {fsub['misses']} misses)"
+    )
+
+@Client.on_message(filters.command("storage") & admin_filter)
+async def storage_command(bot: Client, message: Message):
+    """Storage channels with their startup check result and uploads placed"""
+    lines = [f"💾 **Storage Channels** ({bot.storage.policy} placement)\n"]
+    for row in bot.storage.stats():
+        state = "✅" if row["writable"] else f"❌ {bot.storage.errors.get(row['channel'], 'unchecked')}"
+        lines.append(f"• #{row['channel']} `{row['chat_id']}` {state} — {row['placed']} batches this run")
+    await message.reply_text("\n".join(lines))
+
+@Client.on_message(filters.command("dbstats") & admin_filter)
+async def db_stats_command(bot: Client, message: Message):
+    """Database pool utilization and latency"""
+    stats = db.pool_stats()
+    if stats["backend"] != "postgres":
+        lines = [f"🗄 **Database ({stats.pop('backend')})**\n"]
+        for key, value in stats.items():
+            if key.endswith(("_mean", "_max")):
+                value = f"{value * 1000:.1f} ms"
+            elif isinstance(value, float):
+                value = f"{value:.2f}"
+            lines.append(f"• {key.replace('_', ' ').capitalize()}: {value}")
+        await message.reply_text("\n".join(lines))
+        return
+    await message.reply_text(
+        f"🐘 **Database Pool**\n\n"
+        f"🔌 Connections: {stats['in_use']} in use / {stats['size']} open / {stats['max_size']} max "
+        f"({stats['utilization'] * 100:.0f}%)\n"
+        f"⏳ Waiting: {stats['waiting']} (timeouts: {stats['acquire_timeouts']})\n"
+        f"🕐 Acquire Wait: {stats['acquire_wait_mean'] * 1000:.1f} ms avg / {stats['acquire_wait_max'] * 1000:.1f} ms max\n"
+        f"⚙️ Query Time: {stats['query_time_mean'] * 1000:.1f} ms avg / {stats['query_time_max'] * 1000:.1f} ms max\n"
+        f"📈 Acquires: {stats['acquires']}"
+    )
+
+@Client.on_message(filters.command("purgecache") & admin_filter)
+async def purge_cache_command(bot: Client, message: Message):
+    """Drop every cached file record"""
+    purged = file_cache.clear()
+    await message.reply_text(f"✅ Purged {purged} cached files.")
+
+@Client.on_message(filters.command("dlt_time") & admin_filter)
+async def set_delete_time(bot: Client, message: Message):
+    """Set the auto-delete timer for delivered files"""
+    if len(message.command) < 2:
+        return await message.reply_text("Usage: `/dlt_time <seconds>` (0 disables auto-delete)")
+
+    try:
+        seconds = int(message.command[1])
+    except ValueError:
+        return await message.reply_text("Time should be an integer number of seconds.")
+    if seconds < 0:
+        return await message.reply_text("Time can't be negative.")
+
+    await bot.auto_delete.set_delay(seconds)
+    if seconds:
+        await message.reply_text(f"✅ Delivered files will be deleted after {get_readable_time(seconds)}.")
+    else:
+        await message.reply_text("✅ Auto-delete disabled.")
+
+@Client.on_message(filters.command("check_dlt_time") & admin_filter)
+async def check_delete_time(bot: Client, message: Message):
+    """Show the auto-delete timer and queue"""
+    scheduler = bot.auto_delete
+    timer = get_readable_time(scheduler.delay) if scheduler.delay else "disabled"
+    await message.reply_text(
+        f"⏳ **Auto Delete**\n\n"
+        f"🕐 Timer: {timer}\n"
+        f"📥 Pending: {scheduler.pending}\n"
+        f"🗑 Deleted: {scheduler.deleted} (failed: {scheduler.failed})"
+    )
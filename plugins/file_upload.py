@@ -1,47 +1,253 @@
+import time
 import asyncio
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from database.database import db
-from config import OWNER_ID, CHANNEL_ID, CUSTOM_CAPTION
+from config import OWNER_ID, CUSTOM_CAPTION, LOGGER
+from config import INGEST_WINDOW, INGEST_MAX_WAIT, INGEST_MAX_FILES
 from helper_func import *
 
+# Most messages one forward_messages call accepts
+FORWARD_CHUNK_SIZE = 100
+# Telegram's message length limit, summaries longer than this are split
+MAX_MESSAGE_LENGTH = 4096
+
 def is_admin_or_owner_filter(_, __, message):
     """Filter for admin users and owner"""
     return message.from_user.id == OWNER_ID
 
 admin_or_owner_filter = filters.create(is_admin_or_owner_filter)
 
+async def add_to_catalog(channel: int, *stored_msgs: Message):
+    """Record freshly stored messages of a storage channel in the file catalog"""
+    try:
+        await db.add_files([to_file_record(msg, channel) for msg in stored_msgs])
+    except Exception as e:
+        # Links still work without it, the catalog backfills on first fetch
+        LOGGER(__name__).warning(f"Failed to catalog messages {[msg.id for msg in stored_msgs]}: {e}")
+
+class UploadBatch:
+    """Uploads from one admin waiting to be stored together"""
+
+    def __init__(self):
+        self.messages = []
+        self.status = None
+        self.timer = None
+        self.started = time.monotonic()
+
+# Open upload batches by admin id
+upload_batches = {}
+
+def upload_units(messages):
+    """Split uploads into store calls: one per album, and runs of other files up to FORWARD_CHUNK_SIZE"""
+    units = []
+    seen_groups = set()
+    run = []
+    for msg in messages:
+        if msg.media_group_id:
+            if run:
+                units.append(run)
+                run = []
+            # copy_media_group copies the whole album from any one of its messages
+            if msg.media_group_id not in seen_groups:
+                seen_groups.add(msg.media_group_id)
+                units.append([msg])
+            continue
+        run.append(msg)
+        if len(run) == FORWARD_CHUNK_SIZE:
+            units.append(run)
+            run = []
+    if run:
+        units.append(run)
+    return units
+
+async def store_unit(bot: Client, unit, channel: int):
+    """Store one unit in a storage channel with a single call, returning the stored messages"""
+    first = unit[0]
+    chat_id = bot.storage.chat_id(channel)
+    if first.media_group_id:
+        return await bot.limiter.call(
+            chat_id, bot.copy_media_group,
+            chat_id=chat_id, from_chat_id=first.chat.id, message_id=first.id
+        )
+    # drop_author stores plain copies, like message.copy, without one call per file
+    return await bot.limiter.call(
+        chat_id, bot.forward_messages,
+        chat_id=chat_id, from_chat_id=first.chat.id,
+        message_ids=[msg.id for msg in unit], drop_author=True
+    )
+
+def summary_parts(bot: Client, entries, stored, channel, failed):
+    """Upload summary split into messages that fit Telegram's length limit"""
+    duplicates = sum(1 for _, _, _, duplicate in entries if duplicate)
+    head = f"✅ **{len(stored)} Files Uploaded Successfully!**\n\n"
+    if duplicates:
+        head += f"♻️ **Already Stored:** {duplicates}\n\n"
+    if failed:
+        head += f"❌ **Failed:** {failed}\n\n"
+    if len(stored) > 1:
+        head += f"📦 **Batch Link:** `{share_link(bot, stored[0].id, stored[-1].id, channel)}`\n\n"
+    parts = [head]
+    for name, entry_channel, msg_id, duplicate in entries:
+        mark = " ♻️" if duplicate else ""
+        line = f"• {name}{mark}: `{share_link(bot, msg_id, channel=entry_channel)}`\n"
+        if len(parts[-1]) + len(line) > MAX_MESSAGE_LENGTH:
+            parts.append("")
+        parts[-1] += line
+    return parts
+
+async def find_stored(bot: Client, messages, unique_ids):
+    """(channel, message_id) still holding the files in messages, keyed by file_unique_id.
+
+    Every catalog hit is checked against its storage channel; a message
+    deleted since it was cataloged gets its tombstone and counts as a miss.
+    """
+    wanted = list({uid for uid in unique_ids.values() if uid})
+    if not wanted:
+        return {}
+    try:
+        found = await db.find_files_by_unique_id(wanted)
+        by_channel = {}
+        for uid, (channel, msg_id) in found.items():
+            by_channel.setdefault(channel, {})[msg_id] = uid
+        stale = []
+        for channel, hits in by_channel.items():
+            records = await fetch_file_records(bot, list(hits), channel)
+            for msg_id, uid in hits.items():
+                record = records.get(msg_id) or empty_record(msg_id, channel)
+                if record["file_unique_id"] != uid:
+                    del found[uid]
+                    stale.append(record)
+                    file_cache.pop((channel, msg_id))
+        if stale:
+            await db.add_files(stale)
+        return found
+    except Exception as e:
+        # Storing a duplicate is better than losing the upload or linking a deleted one
+        LOGGER(__name__).warning(f"Failed to look up uploads {[msg.id for msg in messages]}: {e}")
+        return {}
+
+async def flush_uploads(bot: Client, user_id: int, delay: float = 0):
+    """Store an admin's batch after delay seconds and reply with one summary.
+
+    Files already in a storage channel, found by file_unique_id, are not
+    copied again; they reuse the existing message and link. The new files
+    all go to one channel, so the batch link covers them.
+    """
+    if delay:
+        await asyncio.sleep(delay)
+    batch = upload_batches.pop(user_id, None)
+    if not batch:
+        return
+    # Concurrent handlers may append out of order
+    messages = sorted(batch.messages, key=lambda msg: msg.id)
+    unique_ids = {msg.id: get_file_unique_id(msg) for msg in messages}
+    existing = await find_stored(bot, messages, unique_ids)
+
+    albums = {}
+    for msg in messages:
+        if msg.media_group_id:
+            albums.setdefault(msg.media_group_id, []).append(msg)
+    pending = []
+    seen = set()
+    for msg in messages:
+        uid = unique_ids[msg.id]
+        if msg.media_group_id:
+            # An album is copied whole, so it is only skipped when every file is stored
+            if not all(unique_ids[m.id] in existing for m in albums[msg.media_group_id]):
+                pending.append(msg)
+        elif uid not in existing and uid not in seen:
+            pending.append(msg)
+        if uid:
+            seen.add(uid)
+
+    channel = bot.storage.pick() if pending else 0
+    stored = []
+    copies = {}
+    for unit in upload_units(pending):
+        sources = albums[unit[0].media_group_id] if unit[0].media_group_id else unit
+        try:
+            unit_stored = await store_unit(bot, unit, channel)
+        except Exception as e:
+            # Counted as failed below, with everything else that has no link
+            LOGGER(__name__).warning(f"Failed to store uploads {[msg.id for msg in sources]}: {e}")
+            continue
+        stored.extend(unit_stored)
+        for source, copy in zip(sources, unit_stored):
+            copies[source.id] = copy.id
+            uid = unique_ids[source.id]
+            if uid and uid not in existing:
+                # Later copies of the same file in this batch link here
+                existing[uid] = (channel, copy.id)
+    if stored:
+        await add_to_catalog(channel, *stored)
+
+    entries = []
+    failed = 0
+    for msg in messages:
+        if msg.id in copies:
+            entries.append((get_name(msg), channel, copies[msg.id], False))
+        elif unique_ids[msg.id] in existing:
+            entries.append((get_name(msg), *existing[unique_ids[msg.id]], True))
+        else:
+            failed += 1
+    
+    try:
+        if len(entries) == 1 and not failed:
+            _, entry_channel, msg_id, duplicate = entries[0]
+            file_link = share_link(bot, msg_id, channel=entry_channel)
+            title = "♻️ **File Already Stored!**" if duplicate else "✅ **File Uploaded Successfully!**"
+            await batch.status.edit_text(
+                f"{title}\n\n"
+                f"📎 **File Link:** `{file_link}`\n\n"
+                f"📨 **Message ID:** `{msg_id}`\n"
+                f"💾 **Stored in Channel:** `{bot.storage.chat_id(entry_channel)}`",
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🔗 Share Link", url=file_link)],
+                    [InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{msg_id}_{entry_channel}")]
+                ])
+            )
+        elif not entries:
+            await batch.status.edit_text(f"❌ **Upload Failed!**\n\n{failed} files could not be stored.")
+        else:
+            parts = summary_parts(bot, entries, stored, channel, failed)
+            await batch.status.edit_text(parts[0])
+            for part in parts[1:]:
+                await bot.limiter.call(batch.status.chat.id, batch.status.reply_text, part)
+    except Exception as e:
+        LOGGER(__name__).warning(f"Failed to send upload summary: {e}")
+
 @Client.on_message(filters.private & filters.media & admin_or_owner_filter)
 async def handle_file_upload(bot: Client, message: Message):
-    """Handle file uploads from admin/owner"""
+    """Buffer uploads from admin/owner, storing them in bulk once they stop arriving"""
     try:
         # Check if user is banned
         if await db.is_user_banned(message.from_user.id):
             await message.reply_text("You are banned from using this bot!")
             return
         
-        # Forward the file to the database channel
-        temp_msg = await message.reply_text("Processing your file...")
+        user_id = message.from_user.id
+        batch = upload_batches.get(user_id)
+        if batch is None:
+            batch = upload_batches[user_id] = UploadBatch()
+            batch.messages.append(message)
+            try:
+                batch.status = await message.reply_text("📥 Collecting your files...")
+            except Exception:
+                # Without a status message there is nowhere to report the batch
+                upload_batches.pop(user_id, None)
+                raise
+        else:
+            batch.messages.append(message)
         
-        # Copy message to database channel
-        forwarded_msg = await message.copy(chat_id=CHANNEL_ID)
-        
-        # Generate link for the file
-        file_link = f"https://t.me/{bot.username}?start={await encode(f'get-{forwarded_msg.id * abs(bot.db_channel.id)}')}"
-        
-        # Create response with file link
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔗 Share Link", url=file_link)],
-            [InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{forwarded_msg.id}")]
-        ])
-        
-        await temp_msg.edit_text(
-            f"✅ **File Uploaded Successfully!**\n\n"
-            f"📎 **File Link:** `{file_link}`\n\n"
-            f"📨 **Message ID:** `{forwarded_msg.id}`\n"
-            f"💾 **Stored in Channel:** `{CHANNEL_ID}`",
-            reply_markup=reply_markup
-        )
+        if batch.timer:
+            batch.timer.cancel()
+        # Wait for a quiet window, but never longer than INGEST_MAX_WAIT in total
+        delay = max(0, min(INGEST_WINDOW, INGEST_MAX_WAIT - (time.monotonic() - batch.started)))
+        if len(batch.messages) >= INGEST_MAX_FILES:
+            delay = 0
+        if batch.status is not None:
+            batch.timer = asyncio.create_task(flush_uploads(bot, user_id, delay))
         
     except Exception as e:
         await message.reply_text(f"❌ **Upload Failed!**\n\nError: {str(e)}")
@@ -59,22 +265,25 @@ async def handle_text_upload(bot: Client, message: Message):
         temp_msg = await message.reply_text("Processing your message...")
         
         # Copy message to database channel
-        forwarded_msg = await message.copy(chat_id=CHANNEL_ID)
+        channel = bot.storage.pick()
+        chat_id = bot.storage.chat_id(channel)
+        forwarded_msg = await bot.limiter.call(chat_id, message.copy, chat_id=chat_id)
+        await add_to_catalog(channel, forwarded_msg)
         
         # Generate link for the message
-        file_link = f"https://t.me/{bot.username}?start={await encode(f'get-{forwarded_msg.id * abs(bot.db_channel.id)}')}"
+        file_link = share_link(bot, forwarded_msg.id, channel=channel)
         
         # Create response with message link
         reply_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton("🔗 Share Link", url=file_link)],
-            [InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{forwarded_msg.id}")]
+            [InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{forwarded_msg.id}_{channel}")]
         ])
         
         await temp_msg.edit_text(
             f"✅ **Message Uploaded Successfully!**\n\n"
             f"🔗 **Message Link:** `{file_link}`\n\n"
             f"📨 **Message ID:** `{forwarded_msg.id}`\n"
-            f"💾 **Stored in Channel:** `{CHANNEL_ID}`",
+            f"💾 **Stored in Channel:** `{chat_id}`",
             reply_markup=reply_markup
         )
         
@@ -95,12 +304,13 @@ async def handle_non_admin_upload(bot: Client, message: Message):
 async def copy_link_callback(bot: Client, callback_query):
     """Handle copy link button callback"""
     try:
-        msg_id = callback_query.data.split("_")[1]
-        file_link = f"https://t.me/{bot.username}?start={await encode(f'get-{int(msg_id) * abs(bot.db_channel.id)}')}"
+        # Buttons from before several storage channels have no channel part
+        _, msg_id, *channel = callback_query.data.split("_")
+        file_link = share_link(bot, int(msg_id), channel=int(channel[0]) if channel else 0)
         
         await callback_query.answer(
             f"Link copied!\n{file_link}",
             show_alert=True
         )
-    except Exception as e:
+    except Exception:
         await callback_query.answer("Error copying link!", show_alert=True)
\ No newline at end of file
@@ -0,0 +1,23 @@
+from pyrogram import Client, filters
+from config import WORKER_PROCESSES
+
+def update_worker(update) -> int:
+    """Worker process that handles an update: by sender, or by chat for channel posts"""
+    user = getattr(update, "from_user", None)
+    if user:
+        return user.id % WORKER_PROCESSES
+    chat = getattr(update, "chat", None)
+    return chat.id % WORKER_PROCESSES if chat else 0
+
+async def is_other_workers(_, bot, update):
+    return WORKER_PROCESSES > 1 and update_worker(update) != bot.worker_id
+
+other_workers_filter = filters.create(is_other_workers)
+
+# Telegram sends every update to each worker's session. Runs before every
+# other handler so only one worker answers, and always the same one for a
+# user, which keeps their chat lock, upload buffer and conversations in one place.
+@Client.on_message(other_workers_filter, group=-1)
+@Client.on_callback_query(other_workers_filter, group=-1)
+async def skip_other_workers(bot: Client, update):
+    update.stop_propagation()
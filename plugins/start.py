@@ -2,11 +2,24 @@ import os
 import asyncio
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from pyrogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
 from pyrogram.errors import FloodWait, UserNotParticipant, UserBannedInChannel
 from database.database import db
 from config import *
 from helper_func import *
 
+# Storage channel messages fetched per pipeline step
+FETCH_CHUNK_SIZE = 200
+# Telegram's album size limit
+MEDIA_GROUP_SIZE = 10
+# Media types that may share an album; photos and videos mix, the others only with themselves
+ALBUM_KINDS = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+INPUT_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument, "audio": InputMediaAudio}
+# Bounds sends in flight across all chats
+delivery_semaphore = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+# chat_id -> [lock, users]; one delivery per chat at a time keeps files in order
+chat_locks = {}
+
 @Client.on_message(filters.command("start") & filters.private)
 async def start_command(bot: Client, message: Message):
     user_id = message.from_user.id
@@ -14,7 +27,7 @@ async def start_command(bot: Client, message: Message):
     first_name = message.from_user.first_name
     last_name = message.from_user.last_name
     
-    # Add user to database
+    # Queue user upsert (written in bulk by the database flusher)
     try:
         await db.add_user(user_id, username, first_name, last_name)
         
@@ -22,10 +35,15 @@ async def start_command(bot: Client, message: Message):
         if await db.is_user_banned(user_id):
             await message.reply_text("You are banned from using this bot!")
             return
-    except Exception as e:
+    except Exception:
         # Continue without database operations if DB fails
         pass
     
+    missing = await bot.fsub.missing_channels(user_id)
+    if missing:
+        await send_force_sub(bot, message, missing)
+        return
+    
     # Handle file links
     if len(message.command) > 1:
         await handle_file_link(bot, message)
@@ -40,102 +58,281 @@ async def start_command(bot: Client, message: Message):
     ])
     
     if START_PIC:
-        await message.reply_photo(
+        await bot.limiter.call(
+            message.chat.id, message.reply_photo,
             photo=START_PIC,
             caption=START_MSG.format(mention=message.from_user.mention),
             reply_markup=reply_markup
         )
     else:
-        await message.reply_text(
+        await bot.limiter.call(
+            message.chat.id, message.reply_text,
             text=START_MSG.format(mention=message.from_user.mention),
             reply_markup=reply_markup
         )
 
+async def send_force_sub(bot: Client, message: Message, channels, user=None, retry: bool = True):
+    """Ask the user to join the channels they are missing, then retry their /start.
+
+    Replying to one of the bot's own messages, pass the user and retry=False;
+    that message keeps whatever button they retry with.
+    """
+    user = user or message.from_user
+    links = await asyncio.gather(*(bot.fsub.invite_link(channel) for channel in channels), return_exceptions=True)
+    buttons = []
+    for channel, link in zip(channels, links):
+        if isinstance(link, Exception):
+            LOGGER(__name__).warning(f"Failed to get invite link for {channel['channel_id']}: {link}")
+            continue
+        name = f"@{channel['channel_username']}" if channel.get("channel_username") else "ᴄʜᴀɴɴᴇʟ"
+        buttons.append([InlineKeyboardButton(f"ᴊᴏɪɴ {name}", url=link)])
+    if retry:
+        retry_url = f"https://t.me/{bot.username}?start={message.command[1]}" if len(message.command) > 1 else f"https://t.me/{bot.username}?start"
+        buttons.append([InlineKeyboardButton("♻️ ᴛʀʏ ᴀɢᴀɪɴ", url=retry_url)])
+    
+    text = FORCE_MSG.format(mention=user.mention)
+    if FORCE_PIC:
+        await bot.limiter.call(
+            message.chat.id, message.reply_photo,
+            photo=FORCE_PIC, caption=text, reply_markup=InlineKeyboardMarkup(buttons)
+        )
+    else:
+        await bot.limiter.call(
+            message.chat.id, message.reply_text,
+            text=text, reply_markup=InlineKeyboardMarkup(buttons)
+        )
+
 async def handle_file_link(bot: Client, message: Message):
     """Handle file sharing links"""
-    base64_string = message.command[1]
-    string = await decode(base64_string)
+    link = decode_link(message.command[1])
     
-    if not string:
+    if not link or link.kind == PAGE or not bot.storage.valid(link.channel):
         await message.reply_text("❌ Invalid link!")
         return
+    start, end = link.first, link.last
+    await deliver_batch(bot, message, message.from_user.id, start, end, channel=link.channel)
+
+def batch_ids(start, end):
+    """Lazy id sequence of a link, in link order (descending when start > end)"""
+    step = 1 if start <= end else -1
+    return range(start, end + step, step)
+
+async def deliver_batch(bot: Client, message: Message, user_id, start, end, offset=None, channel=0):
+    """Deliver one page of a link, resuming from saved progress and offering the next page"""
+    ids = batch_ids(start, end)
+    total = len(ids)
+    # Channel 0 keeps the key it had before there were several channels
+    batch_key = f"{start}-{end}" if not channel else f"{channel}:{start}-{end}"
     
-    if not string.startswith("get-"):
-        await message.reply_text("❌ Invalid link format!")
-        return
+    if offset is None:
+        offset = 0
+        if total > 1:
+            try:
+                saved = await db.get_delivery_progress(user_id, batch_key)
+            except Exception as e:
+                LOGGER(__name__).warning(f"Failed to load delivery progress: {e}")
+                saved = None
+            if saved and 0 < saved < total:
+                offset = saved
+                await message.reply_text(f"⏯ Resuming from file {offset + 1} of {total}.")
     
-    argument = string.split("-")
+    page_end = min(offset + BATCH_PAGE_SIZE, total)
+    
+    async def save_progress(done):
+        try:
+            await db.set_delivery_progress(user_id, batch_key, offset + done)
+        except Exception as e:
+            LOGGER(__name__).warning(f"Failed to save delivery progress: {e}")
+    
+    completed = await deliver_files(bot, message, ids[offset:page_end], save_progress if total > 1 else None, channel)
+    if total <= 1 or not completed:
+        return
+    if page_end < total:
+        cursor = encode_link(start, end, channel=channel, offset=page_end)
+        await bot.limiter.call(
+            message.chat.id, message.reply_text,
+            f"📦 Sent files {offset + 1}–{page_end} of {total}.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("➡️ Next page", callback_data=f"next_{cursor}")]
+            ])
+        )
+    else:
+        try:
+            await db.clear_delivery_progress(user_id, batch_key)
+        except Exception as e:
+            LOGGER(__name__).warning(f"Failed to clear delivery progress: {e}")
+
+async def fetch_chunks(bot: Client, ids, queue: asyncio.Queue, channel=0):
+    """Producer: resolve ids chunk by chunk so fetching overlaps sending.
+
+    Always ends with None or the error that stopped it, so the consumer never waits forever.
+    """
+    end = None
     try:
-        if len(argument) == 3:
-            # Batch link: get-start-end
-            start = int(int(argument[1]) / abs(bot.db_channel.id))
-            end = int(int(argument[2]) / abs(bot.db_channel.id))
-            if start <= end:
-                ids = list(range(start, end+1))
-            else:
-                ids = []
-                i = start
-                while True:
-                    ids.append(i)
-                    i -= 1
-                    if i < end:
-                        break
-        elif len(argument) == 2:
-            # Single file link: get-msgid
-            ids = [int(int(argument[1]) / abs(bot.db_channel.id))]
-        else:
-            await message.reply_text("❌ Invalid link format!")
-            return
+        for i in range(0, len(ids), FETCH_CHUNK_SIZE):
+            chunk_ids = ids[i:i+FETCH_CHUNK_SIZE]
+            await queue.put((len(chunk_ids), await get_file_records(bot, chunk_ids, channel)))
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            # Cancelled by deliver_files, which no longer reads the queue
+            raise
+        # A fetch shared with other deliveries was cancelled under us
+        end = RuntimeError("fetching the files was cancelled")
     except Exception as e:
-        await message.reply_text(f"❌ Error processing link: {str(e)}")
-        return
-    temp_msg = await message.reply("Please wait...")
+        end = e
+    await queue.put(end)
+
+def group_records(records):
+    """Split records into send units: albums of consecutive compatible media, everything else alone"""
+    if not MEDIA_GROUP_DELIVERY:
+        return [[record] for record in records]
+    units = []
+    current, current_kind = [], None
+    for record in records:
+        kind = ALBUM_KINDS.get(record["media_type"])
+        if current and (kind != current_kind or len(current) == MEDIA_GROUP_SIZE):
+            units.append(current)
+            current = []
+        current_kind = kind
+        if kind is None:
+            units.append([record])
+        else:
+            current.append(record)
+    if current:
+        units.append(current)
+    return units
+
+async def send_unit(message: Message, unit):
+    """Send one record, or a bundle of records as a single album, returning the sent messages"""
+    if len(unit) == 1:
+        return [await send_file_record(message, unit[0])]
+    return await message.reply_media_group([
+        INPUT_MEDIA[record["media_type"]](record["file_id"], caption=format_caption(record))
+        for record in unit
+    ])
+
+async def send_paced(bot: Client, message: Message, unit):
+    """Send a unit through the rate limiter, giving up on it after repeated FloodWaits.
+
+    Returns the sent messages, or None when the unit was given up on.
+    """
+    try:
+        async with delivery_semaphore:
+            return await bot.limiter.call(message.chat.id, send_unit, message, unit, retries=DELIVERY_MAX_RETRIES)
+    except FloodWait:
+        return None
+
+async def deliver_files(bot: Client, message: Message, ids, on_progress=None, channel=0) -> bool:
+    """Stream ids to the user: fetch chunk N+1 while chunk N is being sent.
+
+    on_progress is awaited with the number of ids handled after each chunk.
+    Returns True when every chunk was processed.
+    """
+    chat_id = message.chat.id
+    temp_msg = await bot.limiter.call(chat_id, message.reply, "Please wait...")
+    queue = asyncio.Queue(maxsize=1)
+    producer = asyncio.create_task(fetch_chunks(bot, ids, queue, channel))
+    slot = chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+    slot[1] += 1
+    failed = 0
+    done = 0
+    auto_deleted = False
     
     try:
-        messages = await get_message_from_id(bot, ids)
-        await temp_msg.delete()
-        for msg in messages:
-            try:
-                # Get the original caption
-                original_caption = ""
-                if msg.caption:
-                    original_caption = msg.caption.html if hasattr(msg.caption, 'html') else str(msg.caption)
-                
-                # Get file name
-                file_name = get_name(msg)
-                
-                # Format the custom caption
-                if "{previouscaption}" in CUSTOM_CAPTION or "{filename}" in CUSTOM_CAPTION:
-                    caption = CUSTOM_CAPTION.format(
-                        previouscaption=original_caption,
-                        filename=file_name
-                    )
-                else:
-                    # If no placeholders, just append the custom caption
-                    if original_caption:
-                        caption = f"{original_caption}\n\n{CUSTOM_CAPTION}"
+        async with slot[0]:
+            while True:
+                chunk = await queue.get()
+                if temp_msg:
+                    await bot.limiter.call(chat_id, temp_msg.delete)
+                    temp_msg = None
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                covered, records = chunk
+                sent_ids = []
+                for unit in group_records(records):
+                    try:
+                        sent = await send_paced(bot, message, unit)
+                    except Exception as e:
+                        LOGGER(__name__).warning(f"Failed to send message {unit[0]['message_id']} to {chat_id}: {e}")
+                        sent = None
+                    if sent is None:
+                        failed += len(unit)
                     else:
-                        caption = CUSTOM_CAPTION
-            except Exception as e:
-                # Fallback to original caption or basic info
-                caption = msg.caption.html if msg.caption else f"<b>📁 {get_name(msg)}</b>"
-            
-            reply_markup = None
-            if DISABLE_CHANNEL_BUTTON:
-                reply_markup = None
-            
-            if msg.photo:
-                await message.reply_photo(msg.photo.file_id, caption=caption, reply_markup=reply_markup)
-            elif msg.video:
-                await message.reply_video(msg.video.file_id, caption=caption, reply_markup=reply_markup)
-            elif msg.document:
-                await message.reply_document(msg.document.file_id, caption=caption, reply_markup=reply_markup)
-            elif msg.audio:
-                await message.reply_audio(msg.audio.file_id, caption=caption, reply_markup=reply_markup)
-            else:
-                await message.reply_text(msg.text.html if msg.text else "No content", reply_markup=reply_markup)
+                        sent_ids.extend(msg.id for msg in sent if msg)
+                # One queue write per chunk rather than per file
+                try:
+                    if await bot.auto_delete.schedule(chat_id, sent_ids):
+                        auto_deleted = True
+                except Exception as e:
+                    LOGGER(__name__).warning(f"Failed to schedule deletion of {len(sent_ids)} messages in {chat_id}: {e}")
+                done += covered
+                if on_progress:
+                    await on_progress(done)
+        if failed:
+            await bot.limiter.call(
+                chat_id, message.reply_text,
+                f"⚠️ {failed} file(s) could not be sent, please try the link again later."
+            )
+        if auto_deleted:
+            await bot.limiter.call(
+                chat_id, message.reply_text,
+                f"⏳ These files will be deleted in {get_readable_time(bot.auto_delete.delay)}, forward them to your saved messages to keep them."
+            )
+        return True
     except Exception as e:
-        await message.reply_text(f"Something went wrong!\n\n**Error:** {e}")
+        await bot.limiter.call(chat_id, message.reply_text, f"Something went wrong!\n\n**Error:** {e}")
+        return False
+    finally:
+        producer.cancel()
+        slot[1] -= 1
+        if not slot[1]:
+            chat_locks.pop(chat_id, None)
+
+def format_caption(record):
+    """Render CUSTOM_CAPTION for a catalog record"""
+    try:
+        original_caption = record["caption"] or ""
+        file_name = record["file_name"] or record["media_type"]
+        
+        # Format the custom caption
+        if "{previouscaption}" in CUSTOM_CAPTION or "{filename}" in CUSTOM_CAPTION:
+            return CUSTOM_CAPTION.format(
+                previouscaption=original_caption,
+                filename=file_name
+            )
+        # If no placeholders, just append the custom caption
+        if original_caption:
+            return f"{original_caption}\n\n{CUSTOM_CAPTION}"
+        return CUSTOM_CAPTION
+    except Exception:
+        # Fallback to original caption or basic info
+        return record["caption"] or f"<b>📁 {record['file_name'] or record['media_type']}</b>"
+
+async def send_file_record(message: Message, record):
+    """Send one catalog record to the chat of message, returning the sent message"""
+    media_type = record["media_type"]
+    file_id = record["file_id"]
+    
+    if media_type == "photo":
+        return await message.reply_photo(file_id, caption=format_caption(record))
+    elif media_type == "video":
+        return await message.reply_video(file_id, caption=format_caption(record))
+    elif media_type == "document":
+        return await message.reply_document(file_id, caption=format_caption(record))
+    elif media_type == "audio":
+        return await message.reply_audio(file_id, caption=format_caption(record))
+    elif media_type == "voice":
+        return await message.reply_voice(file_id, caption=format_caption(record))
+    elif media_type == "animation":
+        return await message.reply_animation(file_id, caption=format_caption(record))
+    elif media_type == "sticker":
+        return await message.reply_sticker(file_id)
+    elif media_type == "video_note":
+        return await message.reply_video_note(file_id)
+    else:
+        return await message.reply_text(record["caption"] or "No content")
 
 @Client.on_callback_query()
 async def cb_handler(bot: Client, query: CallbackQuery):
@@ -156,7 +353,7 @@ async def cb_handler(bot: Client, query: CallbackQuery):
             ])
         )
     elif data == "stats":
-        users_count = await db.get_users_count()
+        users_count = (await db.get_stats())['total_users']
         await query.message.edit_text(
             text=f"📊 **Bot Statistics**\n\n👥 Total Users: {users_count}",
             reply_markup=InlineKeyboardMarkup([
@@ -175,4 +372,23 @@ async def cb_handler(bot: Client, query: CallbackQuery):
             reply_markup=reply_markup
         )
     elif data == "close":
-        await query.message.delete()
\ No newline at end of file
+        await query.message.delete()
+    elif data.startswith("next_"):
+        if await db.is_user_banned(query.from_user.id):
+            await query.answer("You are banned from using this bot!", show_alert=True)
+            return
+        missing = await bot.fsub.missing_channels(query.from_user.id)
+        if missing:
+            # The Next button stays, so they can press it again after joining
+            await query.answer("Join the channels first, then press Next page again.", show_alert=True)
+            await send_force_sub(bot, query.message, missing, user=query.from_user, retry=False)
+            return
+        link = decode_link(data[5:])
+        if not link or link.kind != PAGE or not bot.storage.valid(link.channel):
+            await query.answer("❌ Invalid page link!", show_alert=True)
+            return
+        start, end, offset = link.first, link.last, link.offset
+        await query.answer()
+        # Drop the button so the same page can't be requested twice
+        await query.message.edit_reply_markup(None)
+        await deliver_batch(bot, query.message, query.from_user.id, start, end, offset, link.channel)
\ No newline at end of file
@@ -1,21 +1,28 @@
 from aiohttp import web
 from aiohttp.web_response import Response
+from startup import RUNNING
 
 routes = web.RouteTableDef()
 
 @routes.get("/", allow_head=True)
 async def root_route_handler(request):
     return web.json_response({
-        "status": "running",
+        "status": request.app["bot"].startup.state,
         "message": "FileStore Bot is running!",
         "author": "Codeflix Bots"
     })
 
 @routes.get("/health")
 async def health_check(request):
-    return web.json_response({"status": "healthy"})
+    # Bound before the bot connects, so the platform sees the port right away
+    startup = request.app["bot"].startup
+    return web.json_response({
+        "status": "healthy" if startup.state == RUNNING else startup.state,
+        "startup": startup.snapshot()
+    })
 
-async def web_server():
+async def web_server(bot):
     web_app = web.Application(client_max_size=30000000)
+    web_app["bot"] = bot
     web_app.router.add_routes(routes)
-    return web_app
\ No newline at end of file
+    return web_app
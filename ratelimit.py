@@ -0,0 +1,143 @@
+import time
+import asyncio
+from pyrogram.errors import FloodWait
+
+# Priority lanes: interactive replies preempt bulk traffic such as broadcasts
+INTERACTIVE = 0
+BULK = 1
+
+# Idle per-chat buckets are pruned once this many are tracked
+MAX_CHAT_BUCKETS = 10000
+# Longest pause a FloodWait in one chat imposes on every other chat, in seconds
+FLOOD_GLOBAL_CAP = 5
+
+class TokenBucket:
+    """Refills rate tokens per second up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, reserve: float = 0) -> float:
+        """Seconds until a token is available while keeping reserve tokens untouched"""
+        self._refill(now)
+        missing = 1 + reserve - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1
+
+    def drain(self, now, seconds: float):
+        """Push the bucket into debt so nothing is allowed for seconds"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    @property
+    def idle(self) -> bool:
+        return self.tokens >= self.capacity
+
+class RateLimiter:
+    """Scheduler for every outgoing Telegram call.
+
+    Each call takes a token from the global bucket and from the bucket of
+    its chat (private chats and groups have separate rates). Bulk callers
+    leave a reserve in the global bucket and stand aside while interactive
+    callers are waiting on it. A FloodWait holds its chat for the full wait
+    and pauses everyone else for at most FLOOD_GLOBAL_CAP seconds; one
+    without a chat is account-wide and pauses everyone for the full wait.
+    """
+
+    def __init__(self, global_rate: float, private_rate: float, group_rate: float, chat_burst: float = 1, bulk_reserve: float = 0.2):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.bulk_reserve = global_rate * bulk_reserve
+        self.chat_buckets = {}
+        self.paused_until = 0.0
+        self._interactive_contending = 0
+        self.calls = [0, 0]
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle}
+            # Positive ids are users, negative ids are groups and channels
+            rate = self.private_rate if chat_id > 0 else self.group_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id=None, priority=INTERACTIVE):
+        """Wait until a call to chat_id (or no chat) may be made"""
+        contending = False
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self.paused_until - now
+                if delay <= 0 and chat_id is not None:
+                    delay = self._chat_bucket(chat_id).delay(now)
+                if delay <= 0:
+                    if priority == INTERACTIVE:
+                        delay = self.global_bucket.delay(now)
+                        if delay > 0 and not contending:
+                            contending = True
+                            self._interactive_contending += 1
+                    elif self._interactive_contending:
+                        delay = 1 / self.global_bucket.rate
+                    else:
+                        delay = self.global_bucket.delay(now, self.bulk_reserve)
+                if delay <= 0:
+                    self.global_bucket.take()
+                    if chat_id is not None:
+                        self._chat_bucket(chat_id).take()
+                    self.calls[priority] += 1
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            if contending:
+                self._interactive_contending -= 1
+
+    def flood(self, seconds: float, chat_id=None):
+        """Apply a FloodWait: hold the offending chat for the full wait, and briefly pause every lane"""
+        now = time.monotonic()
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        if chat_id is None:
+            self.paused_until = max(self.paused_until, now + seconds)
+            return
+        # A long per-chat wait, common in groups, must not freeze replies to everyone else
+        self.paused_until = max(self.paused_until, now + min(seconds, FLOOD_GLOBAL_CAP))
+        self._chat_bucket(chat_id).drain(now, seconds)
+
+    async def call(self, chat_id, func, /, *args, priority=INTERACTIVE, retries: int = 3, **kwargs):
+        """Run func(*args, **kwargs) once allowed, retrying after FloodWait up to retries times.
+
+        chat_id and func are positional-only so func may itself take a chat_id keyword.
+        """
+        for attempt in range(retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood(e.value, chat_id)
+                if attempt == retries:
+                    raise
+
+    def stats(self) -> dict:
+        return {
+            "interactive_calls": self.calls[INTERACTIVE],
+            "bulk_calls": self.calls[BULK],
+            "flood_waits": self.flood_waits,
+            "flood_seconds": self.flood_seconds,
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            "chats": len(self.chat_buckets),
+        }
@@ -0,0 +1,42 @@
+import time
+from config import LOGGER
+
+STARTING = "starting"
+RUNNING = "running"
+
+class StartupTracker:
+    """Startup state and the time each startup phase took.
+
+    Phases run concurrently where they don't depend on each other, so their
+    durations overlap and add up to more than the total. The state and
+    timings are logged once startup finishes and served by the web
+    health endpoint from the moment it is bound.
+    """
+
+    def __init__(self):
+        self.state = STARTING
+        self.began = time.monotonic()
+        self.phases = {}  # phase -> seconds, in completion order
+        self.total = None
+        self.logger = LOGGER(__name__)
+
+    async def run(self, phase: str, awaitable):
+        """Await one phase and record how long it took, even when it fails"""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.phases[phase] = time.monotonic() - started
+
+    def ready(self):
+        self.state = RUNNING
+        self.total = time.monotonic() - self.began
+        timings = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        self.logger.info(f"Started in {self.total:.2f}s ({timings})")
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "elapsed": round(self.total if self.total is not None else time.monotonic() - self.began, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+        }
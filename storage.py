@@ -0,0 +1,82 @@
+import time
+import asyncio
+from config import LOGGER, STORAGE_CHANNELS, STORAGE_PLACEMENT
+
+ROUND_ROBIN = "round_robin"
+LEAST_RECENTLY_USED = "lru"
+
+class StorageChannels:
+    """The db channels stored files are spread over.
+
+    Channel 0 is CHANNEL_ID and the others follow in STORAGE_CHANNELS
+    order. Links and the file catalog refer to a channel by that position,
+    so reads go straight to the channel a link names and the list may only
+    ever be appended to. Each upload batch is placed on one channel, in
+    turn (round_robin) or the one written to least recently (lru), among
+    the channels that passed the startup check.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.ids = list(STORAGE_CHANNELS)
+        self.policy = STORAGE_PLACEMENT if STORAGE_PLACEMENT in (ROUND_ROBIN, LEAST_RECENTLY_USED) else ROUND_ROBIN
+        self.writable = list(range(len(self.ids)))
+        self.errors = {}  # channel -> why it failed the startup check
+        self.last_used = [0.0] * len(self.ids)
+        self.placed = [0] * len(self.ids)
+        self._turn = 0
+        self.logger = LOGGER(__name__)
+        if self.policy != STORAGE_PLACEMENT:
+            self.logger.warning(f"Unknown STORAGE_PLACEMENT {STORAGE_PLACEMENT!r}, using {ROUND_ROBIN}")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def valid(self, channel: int) -> bool:
+        """Whether a link's channel index names a configured channel"""
+        return 0 <= channel < len(self.ids)
+
+    def chat_id(self, channel: int) -> int:
+        return self.ids[channel]
+
+    async def verify(self, test: bool = True) -> list:
+        """Check every channel concurrently; returns the writable ones.
+
+        With test, a message is sent and deleted in each channel to prove the
+        bot may post there. Channels failing the check get no new uploads.
+        """
+        results = await asyncio.gather(
+            *(self._verify(channel, test) for channel in range(len(self.ids))), return_exceptions=True
+        )
+        self.errors = {channel: result for channel, result in enumerate(results) if isinstance(result, Exception)}
+        for channel, error in self.errors.items():
+            self.logger.warning(f"Storage channel {channel} ({self.ids[channel]}) failed its check: {error}")
+        self.writable = [channel for channel in range(len(self.ids)) if channel not in self.errors]
+        return self.writable
+
+    async def _verify(self, channel: int, test: bool):
+        chat_id = self.ids[channel]
+        await self.bot.limiter.call(None, self.bot.get_chat, chat_id)
+        if test:
+            message = await self.bot.limiter.call(chat_id, self.bot.send_message, chat_id, "Test Message")
+            await message.delete()
+
+    def pick(self) -> int:
+        """Channel index for the next upload batch"""
+        channels = self.writable or [0]
+        if self.policy == LEAST_RECENTLY_USED:
+            channel = min(channels, key=self.last_used.__getitem__)
+        else:
+            channel = channels[self._turn % len(channels)]
+            self._turn += 1
+        # Marked at pick time, so concurrent batches spread out too
+        self.last_used[channel] = time.monotonic()
+        self.placed[channel] += 1
+        return channel
+
+    def stats(self) -> list:
+        """One row per channel: index, chat id, writable, batches placed this run"""
+        return [
+            {"channel": channel, "chat_id": chat_id, "writable": channel in self.writable, "placed": self.placed[channel]}
+            for channel, chat_id in enumerate(self.ids)
+        ]
@@ -0,0 +1,227 @@
+"""Behaviour every storage backend must share.
+
+Runs against memory:// and a temporary SQLite file, and against Postgres
+when TEST_DATABASE_URL points at a disposable database (its tables are
+emptied before each test).
+"""
+import os
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from database.backend import create_backend, MIN_USER_ID
+
+POSTGRES_URL = os.environ.get("TEST_DATABASE_URL")
+# Emptied before each test, the trigger-maintained daily counters included
+POSTGRES_TABLES = ("users", "admins", "force_subscribe_channels", "bot_settings", "files",
+                   "delivery_progress", "broadcasts", "scheduled_deletions", "daily_signups", "daily_active")
+
+@pytest.fixture(params=[
+    "memory",
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(not POSTGRES_URL, reason="TEST_DATABASE_URL not set")),
+])
+def backend_url(request, tmp_path):
+    if request.param == "memory":
+        return "memory://"
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path / 'test.db'}"
+    pytest.importorskip("asyncpg")
+    return POSTGRES_URL
+
+@pytest.fixture
+def run(backend_url):
+    """Run check(backend) on a fresh, connected backend"""
+    def runner(check):
+        async def main():
+            backend = create_backend(backend_url)
+            await backend.connect()
+            try:
+                if backend.name == "postgres":
+                    async with backend.acquire() as conn:
+                        # TRUNCATE skips the row triggers, so the counters are zeroed by hand;
+                        # stats_counters keeps its rows because the triggers only update them
+                        await conn.execute(f"TRUNCATE {', '.join(POSTGRES_TABLES)}")
+                        await conn.execute("UPDATE stats_counters SET value = 0")
+                await check(backend)
+            finally:
+                await backend.close()
+        asyncio.run(main())
+    return runner
+
+def user_row(user_id):
+    return (user_id, f"user{user_id}", f"First{user_id}", None)
+
+def file_record(channel, message_id, unique_id=None):
+    return {
+        'channel': channel, 'message_id': message_id, 'media_type': 'document',
+        'file_id': f"file-{channel}-{message_id}", 'file_unique_id': unique_id,
+        'file_name': f"{message_id}.bin", 'file_size': message_id * 10,
+        'mime_type': 'application/octet-stream', 'caption': None,
+    }
+
+def test_upsert_and_get_user(run):
+    async def check(b):
+        assert await b.get_user(1) is None
+        await b.upsert_users([user_row(1), user_row(2)])
+        user = await b.get_user(1)
+        assert user['username'] == "user1" and user['first_name'] == "First1"
+        assert not user['is_banned'] and user['last_seen_at'] is not None
+        await b.upsert_users([(1, "renamed", None, "Last")])
+        user = await b.get_user(1)
+        assert (user['username'], user['first_name'], user['last_name']) == ("renamed", None, "Last")
+        assert await b.get_users_count() == 2
+        assert sorted(u['user_id'] for u in await b.get_all_users()) == [1, 2]
+    run(check)
+
+def test_bans(run):
+    async def check(b):
+        await b.upsert_users([user_row(1), user_row(2)])
+        await b.set_user_banned(2, True)
+        # Banning someone who never started the bot still records the ban
+        await b.set_user_banned(3, True)
+        assert await b.get_banned_ids() == {2, 3}
+        assert await b.get_banned_count() == 2
+        assert sorted(u['user_id'] for u in await b.get_banned_users()) == [2, 3]
+        await b.set_user_banned(2, False)
+        await b.set_user_banned(4, False)
+        assert await b.get_banned_ids() == {3}
+        assert await b.get_user(4) is None
+    run(check)
+
+def test_user_page_keyset(run):
+    async def check(b):
+        await b.upsert_users([user_row(i) for i in range(1, 11)])
+        seen, after = [], MIN_USER_ID
+        while True:
+            page = await b.get_user_page(['user_id', 'username'], after, 3, None, False)
+            if not page:
+                break
+            assert len(page) <= 3
+            seen += [row['user_id'] for row in page]
+            after = page[-1]['user_id']
+        assert seen == list(range(1, 11))
+
+        await b.set_user_banned(4, True)
+        await b.set_delivery_outcomes([(5, 'blocked'), (6, 'flood')])
+        page = await b.get_user_page(['user_id'], 2, 100, False, True)
+        assert [row['user_id'] for row in page] == [3, 6, 7, 8, 9, 10]
+        page = await b.get_user_page(['user_id'], MIN_USER_ID, 100, True, False)
+        assert [row['user_id'] for row in page] == [4]
+    run(check)
+
+def test_delivery_outcomes(run):
+    async def check(b):
+        await b.upsert_users([user_row(i) for i in range(1, 6)])
+        await b.set_delivery_outcomes([(1, 'blocked'), (2, 'deactivated'), (3, 'flood'), (99, 'blocked')])
+        await b.set_user_banned(2, True)
+        assert await b.get_delivery_status_counts() == {'blocked': 1, 'deactivated': 1, 'flood': 1}
+        assert await b.get_reachable_users_count() == 3
+        # Banned users are kept so their ban survives
+        assert await b.purge_dead_users() == 1
+        assert await b.get_user(1) is None and await b.get_user(2) is not None
+        # Starting the bot again clears the outcome
+        await b.upsert_users([user_row(2)])
+        assert (await b.get_user(2))['delivery_status'] is None
+    run(check)
+
+def test_stats(run):
+    async def check(b):
+        await b.upsert_users([user_row(i) for i in range(1, 4)])
+        await b.set_user_banned(3, True)
+        await b.set_user_banned(4, True)
+        stats = await b.get_stats(7, 7)
+        assert {key: int(value) for key, value in stats.items()} == {
+            'total_users': 4, 'banned_users': 2, 'signups_today': 4,
+            'signups_recent': 4, 'active_users': 3,
+        }
+    run(check)
+
+def test_files(run):
+    async def check(b):
+        await b.add_files([file_record(0, i, f"u{i}") for i in range(1, 6)])
+        await b.add_files([file_record(1, 3, "u3"), file_record(1, 9, "x")])
+        files = await b.get_files_range(5, 2)
+        assert sorted(files) == [2, 3, 4, 5]
+        assert files[3]['file_id'] == "file-0-3" and files[3]['file_size'] == 30
+        assert sorted(await b.get_files_range(1, 10, channel=1)) == [3, 9]
+        assert await b.get_files_range(20, 30) == {}
+
+        found = await b.find_files_by_unique_id(["u3", "x", "missing"])
+        assert {key: tuple(value) for key, value in found.items()} == {"u3": (0, 3), "x": (1, 9)}
+
+        # Re-adding a message replaces its record and its unique id
+        await b.add_files([dict(file_record(0, 3), file_unique_id=None, file_id=None)])
+        assert (await b.get_files_range(3, 3))[3]['file_id'] is None
+        found = await b.find_files_by_unique_id(["u3"])
+        assert tuple(found["u3"]) == (1, 3)
+    run(check)
+
+def test_broadcasts(run):
+    async def check(b):
+        first = await b.create_broadcast(-100, 7, 50, status_chat_id=1, status_message_id=2)
+        second = await b.create_broadcast(-100, 8, 10)
+        assert first != second
+        job = await b.get_broadcast(first)
+        assert (job['status'], job['last_user_id'], job['total'], job['status_message_id']) == ('running', 0, 50, 2)
+
+        await b.checkpoint_broadcast(first, 42, 30, 2)
+        job = await b.get_broadcast(first)
+        assert (job['last_user_id'], job['success'], job['failed']) == (42, 30, 2)
+
+        await b.set_broadcast_status(second, 'cancelled')
+        assert [job['broadcast_id'] for job in await b.get_broadcasts('running')] == [first]
+        assert [job['broadcast_id'] for job in await b.get_broadcasts('cancelled')] == [second]
+        assert await b.get_broadcast(second + 100) is None
+    run(check)
+
+def test_delivery_progress(run):
+    async def check(b):
+        await b.upsert_users([user_row(1)])
+        assert await b.get_delivery_progress(1, "batch") is None
+        await b.set_delivery_progress(1, "batch", 20)
+        await b.set_delivery_progress(1, "batch", 40)
+        await b.set_delivery_progress(1, "other", 5)
+        assert await b.get_delivery_progress(1, "batch") == 40
+        await b.clear_delivery_progress(1, "batch")
+        assert await b.get_delivery_progress(1, "batch") is None
+        assert await b.get_delivery_progress(1, "other") == 5
+    run(check)
+
+def test_scheduled_deletions(run):
+    async def check(b):
+        now = datetime.now().replace(microsecond=0)
+        await b.schedule_deletions([
+            (1, 10, now + timedelta(minutes=5)),
+            (1, 11, now - timedelta(minutes=1)),
+            (2, 10, now + timedelta(minutes=1)),
+        ])
+        assert [row[:2] for row in await b.get_scheduled_deletions()] == [(1, 11), (2, 10), (1, 10)]
+        due = await b.get_scheduled_deletions(now + timedelta(minutes=2))
+        assert [tuple(row) for row in due] == [(1, 11, now - timedelta(minutes=1)), (2, 10, now + timedelta(minutes=1))]
+
+        # Scheduling a message again moves its deadline
+        await b.schedule_deletions([(1, 10, now - timedelta(minutes=2))])
+        await b.remove_deletions([(1, 11), (3, 3)])
+        assert [row[:2] for row in await b.get_scheduled_deletions(now)] == [(1, 10)]
+    run(check)
+
+def test_admins_channels_and_settings(run):
+    async def check(b):
+        await b.add_admin(5)
+        await b.add_admin(5)
+        await b.add_admin(6)
+        await b.remove_admin(6)
+        assert await b.is_admin(5) and not await b.is_admin(6)
+        assert await b.get_all_admins() == [5]
+
+        await b.add_force_sub_channel(-1001, "one")
+        await b.add_force_sub_channel(-1001, "renamed")
+        await b.add_force_sub_channel(-1002)
+        await b.remove_force_sub_channel(-1002)
+        assert [(c['channel_id'], c['channel_username']) for c in await b.get_force_sub_channels()] == [(-1001, "renamed")]
+
+        assert await b.get_setting("key") is None
+        await b.set_setting("key", "a")
+        await b.set_setting("key", "b")
+        assert await b.get_setting("key") == "b"
+    run(check)
@@ -0,0 +1,54 @@
+"""Upload batching: how a stored batch is reported back to the admin."""
+import os
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("pyrogram")
+# The plugins share the process-wide db; keep it off any real database
+os.environ.setdefault("DATABASE_URL", "memory://")
+from plugins import file_upload
+
+class Status:
+    """Stands in for the batch's status message, recording its edits"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+
+def document(msg_id):
+    return SimpleNamespace(
+        id=msg_id, chat=SimpleNamespace(id=1), media_group_id=None,
+        document=SimpleNamespace(file_unique_id=f"u{msg_id}", file_name=f"{msg_id}.bin"),
+    )
+
+def failing_bot():
+    async def call(chat_id, func, /, *args, **kwargs):
+        return await func(*args, **kwargs)
+
+    async def forward_messages(**kwargs):
+        raise RuntimeError("forward failed")
+
+    return SimpleNamespace(
+        storage=SimpleNamespace(pick=lambda: 0, chat_id=lambda channel: -100),
+        limiter=SimpleNamespace(call=call),
+        forward_messages=forward_messages,
+    )
+
+def test_failed_batch_counts_each_file_once(monkeypatch):
+    async def find_stored(bot, messages, unique_ids):
+        return {}
+
+    monkeypatch.setattr(file_upload, "find_stored", find_stored)
+    batch = file_upload.UploadBatch()
+    batch.messages = [document(11), document(10)]
+    batch.status = Status()
+    file_upload.upload_batches[7] = batch
+
+    asyncio.run(file_upload.flush_uploads(failing_bot(), 7))
+
+    assert batch.status.edits == ["❌ **Upload Failed!**\n\n2 files could not be stored."]
+    assert 7 not in file_upload.upload_batches
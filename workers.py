@@ -0,0 +1,95 @@
+import sys
+import time
+import signal
+import multiprocessing
+from config import LOGGER, WORKER_PROCESSES
+
+# Seconds between liveness checks of the worker processes
+SUPERVISOR_POLL_INTERVAL = 1
+# A worker that dies sooner than this after starting is restarted with a growing delay
+MIN_WORKER_UPTIME = 30
+# Longest delay before restarting a worker that keeps dying
+MAX_RESTART_DELAY = 60
+# Seconds workers get to shut down cleanly before they are killed
+SHUTDOWN_TIMEOUT = 30
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_worker(worker_id: int):
+    """Worker process entry point: run one bot with its own session"""
+    # Only the supervisor reacts to Ctrl+C; workers shut down cleanly on the SIGTERM it sends
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, interrupt)
+    import pyrogram.utils
+    from bot import Bot
+    pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
+    Bot(worker_id).run()
+
+class Worker:
+    """One supervised worker process and its restart bookkeeping"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process = None
+        self.started = 0.0
+        self.restart_delay = 1
+        self.restart_at = 0.0
+
+def supervise(count: int = WORKER_PROCESSES):
+    """Run count worker processes and restart any that exits, until interrupted.
+
+    Each worker is a full bot with its own session, sharing the database.
+    Singleton duties are not the supervisor's concern: the workers elect a
+    leader among themselves through the database, so a dead leader is
+    replaced by a running worker well before the supervisor restarts it.
+    """
+    logger = LOGGER(__name__)
+    from database.database import db
+    if db.backend.name != "postgres":
+        logger.error(f"WORKER_PROCESSES={count} needs PostgreSQL, the {db.backend.name} backend is single-process")
+        sys.exit(1)
+
+    # Spawned workers start from a clean interpreter, nothing of the supervisor's state is inherited
+    context = multiprocessing.get_context("spawn")
+    workers = [Worker(worker_id) for worker_id in range(count)]
+
+    def start(worker: Worker):
+        worker.process = context.Process(target=run_worker, args=(worker.worker_id,), name=f"worker-{worker.worker_id}")
+        worker.process.start()
+        worker.started = time.monotonic()
+        logger.info(f"Started worker {worker.worker_id} (pid {worker.process.pid})")
+
+    signal.signal(signal.SIGTERM, interrupt)
+    for worker in workers:
+        start(worker)
+    try:
+        while True:
+            time.sleep(SUPERVISOR_POLL_INTERVAL)
+            now = time.monotonic()
+            for worker in workers:
+                if worker.process.is_alive():
+                    continue
+                if not worker.restart_at:
+                    if now - worker.started >= MIN_WORKER_UPTIME:
+                        worker.restart_delay = 1
+                    worker.restart_at = now + worker.restart_delay
+                    logger.warning(
+                        f"Worker {worker.worker_id} exited with code {worker.process.exitcode}, "
+                        f"restarting in {worker.restart_delay}s"
+                    )
+                    worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+                elif now >= worker.restart_at:
+                    worker.restart_at = 0.0
+                    start(worker)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.process.join(max(0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.kill()